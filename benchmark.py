@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# Benchmarks for decoding, state parsing and full register scans against the
+# mock client. Save a run on a known good version and compare later ones to it:
+#
+#   python3 benchmark.py --save baseline.json
+#   python3 benchmark.py --compare baseline.json
+
+import argparse
+import json
+import struct
+import sys
+import time
+
+from pymodbus.register_read_message import ReadInputRegistersResponse
+
+from pyepsolartracer.client import EPsolarTracerClient, parse_battery_state, parse_charger_state
+from pyepsolartracer.registers import registers, coils, registerByName
+from test.testdata import ModbusImageMockClient
+
+def measure(function, number, repeat = 5):
+    # best of several runs, in microseconds per call
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            function()
+        elapsed = (time.perf_counter() - start) / number * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_decode(number):
+    one = registerByName("Charging equipment input voltage")
+    two = registerByName("Battery Current")
+    response = ReadInputRegistersResponse([0xff9c, 0xffff])
+    return {
+        "decode 1 word [us]": measure(lambda: one.decode(response), number),
+        "decode 2 words [us]": measure(lambda: two.decode(response), number),
+    }
+
+def bench_block(number):
+    from pyepsolartracer.blocks import plan_reads
+    block = plan_reads(registers)[1]
+    words = list(range(block.count))
+    response = ReadInputRegistersResponse(words)
+    payload = memoryview(struct.pack('>%dH' % block.count, *words))
+    return {
+        "decode block words [us]": measure(lambda: block.decode(response), number),
+        "decode block payload [us]": measure(lambda: block.decode_payload(payload), number),
+    }
+
+def bench_format(number):
+    value = registerByName("Charging equipment input voltage").decode(ReadInputRegistersResponse([4830]))
+    return {
+        "format Value [us]": measure(lambda: str(value), number),
+    }
+
+def bench_crc(number):
+    from pyepsolartracer.rtu import crc16
+    # a 72 byte response, the longest of a read_all
+    frame = bytes(range(72))
+    return {
+        "crc 72 bytes [us]": measure(lambda: crc16(frame), number),
+    }
+
+def bench_states(repeat):
+    def battery():
+        for state in range(0x10000):
+            parse_battery_state(state)
+    def charger():
+        for state in range(0x10000):
+            parse_charger_state(state)
+    results = {
+        "parse 65536 battery states [us]": measure(battery, 1, repeat),
+        "parse 65536 charger states [us]": measure(charger, 1, repeat),
+    }
+    try:
+        import numpy as np
+        from pyepsolartracer.batch import battery_state_masks
+    except ImportError:
+        return results
+    states = np.arange(0x10000)
+    battery_state_masks(states)
+    results["mask 65536 battery states [us]"] = measure(lambda: battery_state_masks(states), 1, repeat)
+    return results
+
+def bench_scan(name, scan, repeat = 5):
+    elapsed = None
+    for i in range(repeat):
+        mock = ModbusImageMockClient()
+        client = EPsolarTracerClient(serialclient = mock)
+        start = time.perf_counter()
+        scan(client)
+        run = (time.perf_counter() - start) * 1e6
+        elapsed = run if elapsed is None else min(elapsed, run)
+    return {
+        name + " transactions": mock.transactions,
+        name + " bytes sent": mock.bytes_sent,
+        name + " bytes received": mock.bytes_received,
+        name + " wall time [us]": elapsed,
+    }
+
+def run(quick):
+    number = 2000 if quick else 20000
+    results = {}
+    results.update(bench_decode(number))
+    results.update(bench_block(number))
+    results.update(bench_format(number))
+    results.update(bench_crc(number))
+    results.update(bench_states(1 if quick else 3))
+    names = [reg.name for reg in registers] + [reg.name for reg in coils]
+    results.update(bench_scan("scan read_input", lambda client: [client.read_input(name) for name in names]))
+    results.update(bench_scan("scan read_all", lambda client: client.read_all()))
+    return results
+
+def compare(results, baseline, tolerance):
+    # transactions and bytes must not grow at all, times by at most tolerance
+    regressions = []
+    for key, old in baseline.items():
+        if key not in results:
+            continue
+        limit = old * (1 + tolerance) if key.endswith("[us]") else old
+        if results[key] > limit:
+            regressions.append("%s: %.1f -> %.1f" % (key, old, results[key]))
+    return regressions
+
+parser = argparse.ArgumentParser(description = "Benchmark decoding and register scans")
+parser.add_argument('--quick', action = 'store_true', help = "fewer iterations")
+parser.add_argument('--save', help = "write the results to a JSON file")
+parser.add_argument('--compare', help = "compare with results saved before, exit 1 on regressions")
+parser.add_argument('--tolerance', type = float, default = 0.25, help = "allowed slowdown, 0.25 is 25%%")
+args = parser.parse_args()
+
+results = run(args.quick)
+for key, value in results.items():
+    print("%-40s %12.1f" % (key, value))
+
+if args.save:
+    with open(args.save, 'w') as f:
+        json.dump(results, f, indent = 2)
+
+if args.compare:
+    with open(args.compare) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    sys.exit(1 if regressions else 0)
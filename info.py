@@ -32,12 +32,12 @@ client = EPsolarTracerClient(serialclient = serialclient)
 #print("Version:", repr(response.information[2]))
 
 # for logging, only interested in registers
-for reg in registers:
-    value = client.read_input(reg.name)
+# read_many fetches them in a few block reads instead of one read per register
+for value in client.read_many([reg.name for reg in registers]):
     print(value)
     # and only the read-registers
     #if value.value is not None:
-    #    print(client.write_output(reg.name,value.value))
+    #    print(client.write_output(value.register.name,value.value))
 
 # no coils ("switches") either
 #for reg in coils:
@@ -1,36 +1,45 @@
+#!/usr/bin/env python3
+
+# plot the samples logged by watch.sh (log.txt) or the poller's binary store
+#
+#   python3 plot.py --start 2023-06-01 --end 2023-06-08 "Battery SOC" "Charging equipment input power"
+
+import argparse
+import datetime
+
 import matplotlib.pyplot as plt
-from dateutil.parser import parse
-
-# analyze the logs created by watch.sh
-
-f = open("log.txt", "r")
-
-times = []
-input_ws = []
-output_ws = []
-socs = []
-
-for l in f:
-    if "BST" in l:
-        times.append(parse(l))
-    if "Charging equipment input power = " in l:
-        input_ws.append(float((l.split(" ")[-1])[0:-2]))
-    if "Battery SOC" in l:
-        socs.append(float((l.split(" ")[-1])[0:-2]))
-    if "Discharging equipment output power = " in l:
-        output_ws.append(float((l.split(" ")[-1])[0:-2]))
-
-
-fig, axs = plt.subplots(3, 1, sharex=True)
-axs[0].step(times, input_ws)
-axs[0].set_title("Input W")
-axs[0].grid(True)
-axs[1].step(times, output_ws)
-axs[1].set_title("Output W")
-axs[1].grid(True)
-axs[2].step(times, socs)
-axs[2].set_title("State of Charge")
-axs[2].grid(True)
 
+from pyepsolartracer.logdata import load
+from pyepsolartracer.registers import registerByName
+
+DEFAULT_NAMES = [
+    "Charging equipment input power",
+    "Discharging equipment output power",
+    "Battery SOC",
+]
+
+def timestamp(text):
+    # naive times are local time
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+parser = argparse.ArgumentParser(description = "Plot logged registers")
+parser.add_argument('names', nargs = '*', default = DEFAULT_NAMES, help = "register names to plot")
+parser.add_argument('--input', default = "log.txt", help = "text log or binary sample store")
+parser.add_argument('--start', type = timestamp, help = "first time to plot, ISO 8601")
+parser.add_argument('--end', type = timestamp, help = "last time to plot, ISO 8601")
+parser.add_argument('--utcoffset', type = float, help = "hours the logged times are ahead of UTC, local time by default")
+args = parser.parse_args()
+
+utcoffset = None if args.utcoffset is None else args.utcoffset * 3600
+columns = load(args.input, args.names, args.start, args.end, utcoffset)
+# shown in local time, like --start and --end
+times = [datetime.datetime.fromtimestamp(t) for t in columns['time']]
+
+fig, axs = plt.subplots(len(args.names), 1, sharex=True, squeeze=False)
+for ax, name in zip(axs[:, 0], args.names):
+    ax.step(times, columns[name])
+    unit = registerByName(name).unit.symbol
+    ax.set_title(name + (" [" + unit + "]" if unit else ""))
+    ax.grid(True)
 
 plt.show()
@@ -0,0 +1,181 @@
+# -*- coding: iso-8859-15 -*-
+
+# import the server implementation
+from pymodbus.client import AsyncModbusSerialClient as AsyncModbusClient
+from pymodbus.exceptions import ModbusException
+from pymodbus.mei_message import ReadDeviceInformationRequest
+from pyepsolartracer.registers import registerByName
+from pyepsolartracer.metrics import outcome, EXCEPTION
+from pyepsolartracer.blocks import plan_reads, plan_writes, \
+    COIL, DISCRETE_INPUT, INPUT_REGISTER, \
+    DEFAULT_MAX_SPAN, DEFAULT_MAX_GAP, DEFAULT_MAX_BIT_GAP
+from pyepsolartracer.client import parse_battery_state, parse_charger_state, \
+    battery_state_flags, charger_state_flags, clock_values, parse_clock, CLOCK, _written
+
+import asyncio
+import datetime
+import time
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class AsyncEPsolarTracerClient:
+    ''' EPsolar Tracer client for asyncio
+
+    Same interface as EPsolarTracerClient, but all methods talking to the
+    device are coroutines. One event loop can drive many of these clients,
+    each on its own port, concurrently.
+    '''
+
+    def __init__(self, unit = 1, serialclient = None, max_span = DEFAULT_MAX_SPAN, max_gap = DEFAULT_MAX_GAP, metrics = None,
+                 max_bit_gap = DEFAULT_MAX_BIT_GAP, **kwargs):
+        ''' Initialize an asyncio serial client instance
+
+        :param serialclient: An AsyncModbusSerialClient or compatible client
+        :param max_span: The maximum number of addresses read in one block by read_many
+        :param max_gap: The maximum number of unused addresses inside one block
+        :param metrics: An optional TransactionMetrics recording every transaction
+        :param max_bit_gap: The maximum number of unused addresses inside one
+            block of coils or discrete inputs
+        '''
+        self.unit = unit
+        self.metrics = metrics
+        self.max_span = max_span
+        self.max_gap = max_gap
+        self.max_bit_gap = max_bit_gap
+        if serialclient == None:
+            port = kwargs.pop('port', '/dev/ttyXRUSB0')
+            baudrate = kwargs.pop('baudrate', 115200)
+            self.client = AsyncModbusClient(port, baudrate = baudrate, **kwargs)
+        else:
+            self.client = serialclient
+
+    async def connect(self):
+        ''' Connect to the serial
+        :returns: True if connection succeeded, False otherwise
+        '''
+        return await self.client.connect()
+
+    async def close(self):
+        ''' Closes the underlying connection
+        '''
+        return await self.client.close()
+
+    async def read_device_info(self):
+        request = ReadDeviceInformationRequest (slave = self.unit)
+        return await self._execute(self.client.execute(request))
+
+    parse_battery_state = staticmethod(parse_battery_state)
+    parse_charger_state = staticmethod(parse_charger_state)
+    battery_state_flags = staticmethod(battery_state_flags)
+    charger_state_flags = staticmethod(charger_state_flags)
+
+    async def _execute(self, pending, function = None, count = 0):
+        ''' Waits for a response, turning failed transactions into no response
+
+        The asyncio client raises on timeouts where the blocking client
+        returns an error, the decoders expect the latter.
+        '''
+        start = time.perf_counter()
+        try:
+            response = await pending
+        except (asyncio.TimeoutError, ModbusException) as e:
+            _logger.info("Transaction failed: " + repr(e))
+            response = None
+        if self.metrics is not None and function is not None:
+            self.metrics.record(self.unit, function, count, time.perf_counter() - start, response)
+        return response
+
+    async def _read(self, kind, address, count):
+        ''' Issues a single read transaction
+        '''
+        if kind == COIL:
+            function, pending = 1, self.client.read_coils(address=address, count=count, slave = self.unit)
+        elif kind == DISCRETE_INPUT:
+            function, pending = 2, self.client.read_discrete_inputs(address=address, count=count, slave = self.unit)
+        elif kind == INPUT_REGISTER:
+            function, pending = 4, self.client.read_input_registers(address=address, count=count, slave = self.unit)
+        else:
+            function, pending = 3, self.client.read_holding_registers(address=address, count=count, slave = self.unit)
+        return await self._execute(pending, function, count)
+
+    async def read_input(self, name):
+        register = registerByName(name)
+        block = plan_reads([register])[0]
+        return block.decode(await self._read(block.kind, block.address, block.count))[0]
+
+    async def read_many(self, names):
+        ''' Reads several registers with as few transactions as possible
+
+        Blocks rejected with an exception response are retried register by
+        register, blocks without an answer give None for all their registers.
+
+        :param names: The names of the registers to read
+        :returns: A list of Values, in the order of names
+        '''
+        wanted = [registerByName(name) for name in names]
+        values = {}
+        for block in plan_reads(wanted, self.max_span, self.max_gap, max_bit_gap = self.max_bit_gap):
+            response = await self._read(block.kind, block.address, block.count)
+            if len(block.registers) > 1 and not block.complete(response) and outcome(response) == EXCEPTION:
+                _logger.info("Block read failed, reading registers one by one " + str(block))
+                for reg in block.registers:
+                    values[id(reg)] = await self.read_input(reg.name)
+                continue
+            for reg, value in zip(block.registers, block.decode(response)):
+                values[id(reg)] = value
+        return [values[id(reg)] for reg in wanted]
+
+    async def read_all(self):
+        ''' Reads all known registers and coils
+
+        :returns: A list of Values, registers first, then coils
+        '''
+        from pyepsolartracer.registers import registers, coils
+        return await self.read_many([reg.name for reg in registers] + [reg.name for reg in coils])
+
+    async def _write(self, block):
+        ''' Issues a single write transaction
+        '''
+        if block.kind == COIL:
+            function, pending = 5, self.client.write_coil(address=block.address, value=block.words[0], slave = self.unit)
+        else:
+            function, pending = 16, self.client.write_registers(address=block.address, values=block.words, slave = self.unit)
+        return await self._execute(pending, function, block.count)
+
+    async def write_many(self, values):
+        ''' Writes several registers with as few transactions as possible
+
+        :param values: A dict of register name to scaled value
+        :returns: True if all writes succeeded, False otherwise
+        '''
+        try:
+            blocks = plan_writes([(registerByName(name), value) for name, value in values.items()])
+        except ValueError as e:
+            _logger.error(str(e))
+            return False
+        response = True
+        for block in blocks:
+            if not _written(await self._write(block)):
+                _logger.error("Write failed " + str(block))
+                response = False
+        return response
+
+    async def write_output(self, name, value):
+        return await self.write_many({name: value})
+
+    async def read_clock(self):
+        return parse_clock(await self.read_many(CLOCK))
+
+    async def sync_clock(self, when = None):
+        if when is None:
+            when = datetime.datetime.now()
+        return await self.write_many(clock_values(when))
+
+__all__ = [
+    "AsyncEPsolarTracerClient",
+]
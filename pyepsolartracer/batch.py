@@ -0,0 +1,143 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Vectorized decoding of raw register words with NumPy, for bulk reads and
+# for reprocessing recorded data. NumPy is only needed for this module.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class BlockDecoder:
+    ''' Decodes all registers of a block of raw words at once
+
+    The layout is worked out once; decode() then scales every register of
+    every sample in a few array operations, with the same results as
+    Register.decode_words (sign extension, L/H word order and times).
+    '''
+
+    def __init__(self, address, registers, offsets = None):
+        ''' Initialize a decoder for a block layout
+
+        :param address: The address of the first word of the block
+        :param registers: The registers to decode, any of them may be 32 bit
+        :param offsets: The position of the (low) word of every register in
+            the words, by default its distance from address
+        '''
+        if np is None:
+            raise ImportError("NumPy is needed for vectorized decoding")
+        self.address = address
+        self.registers = list(registers)
+        for reg in self.registers:
+            if reg.is_coil() or reg.is_discrete_input():
+                raise ValueError("Cannot decode bits as words " + repr(reg.name))
+        self.names = [reg.name for reg in self.registers]
+        if offsets is None:
+            offsets = [reg.address - address for reg in self.registers]
+        self.count = max(offset + reg.size for offset, reg in zip(offsets, self.registers))
+        self._low = np.array(offsets, dtype = np.intp)
+        # 16 bit registers use their only word as high word for the sign
+        self._high = np.array([offset + reg.size - 1 for offset, reg in zip(offsets, self.registers)], dtype = np.intp)
+        self._wide = np.array([reg.size > 1 for reg in self.registers])
+        self._times = np.array([reg.times for reg in self.registers], dtype = np.float64)
+
+    @classmethod
+    def for_block(cls, block):
+        ''' Creates a decoder for a ReadBlock
+        '''
+        return cls(block.address, block.registers)
+
+    def decode_array(self, words):
+        ''' Decodes raw words into scaled values
+
+        :param words: An array of 16 bit words, one block (count,) or one block per row (n, count)
+        :returns: A float64 array of shape (len(registers),) or (n, len(registers))
+        '''
+        words = np.asarray(words)
+        if words.shape[-1] < self.count:
+            raise ValueError("Expected " + str(self.count) + " words, got " + str(words.shape[-1]))
+        words = words.astype(np.int64) & 0xffff
+        low = words[..., self._low]
+        high = words[..., self._high]
+        # sign extension of the most significant word
+        high = np.where(high & 0x8000, high - 0x10000, high)
+        raw = np.where(self._wide, (high << 16) | low, high)
+        return raw / self._times
+
+    def decode(self, words):
+        ''' Decodes raw words into a dict of register name to scaled values
+        '''
+        values = self.decode_array(words)
+        return {name: values[..., i] for i, name in enumerate(self.names)}
+
+    def decode_records(self, words):
+        ''' Decodes raw words into a NumPy structured array, one field per register
+        '''
+        values = np.atleast_2d(self.decode_array(words))
+        dtype = np.dtype([(name, np.float64) for name in self.names])
+        return np.ascontiguousarray(values).view(dtype).reshape(values.shape[:-1])
+
+
+# flags of every 16 bit state value, built on first use
+_state_tables = {}
+
+def _mask(decode, state):
+    return sum(1 << member for member in set(decode(state)))
+
+def _state_masks(decode, states):
+    if np is None:
+        raise ImportError("NumPy is needed for vectorized decoding")
+    table = _state_tables.get(decode)
+    if table is None:
+        table = _state_tables[decode] = np.array([_mask(decode, state) for state in range(0x10000)], dtype = np.uint32)
+    states = np.asarray(states).astype(np.int64)
+    inside = (states >= 0) & (states <= 0xFFFF)
+    masks = table[np.where(inside, states, 0)]
+    if not inside.all():
+        # invalid values are rare, decode them one by one
+        for i in zip(*np.nonzero(~inside)):
+            masks[i] = _mask(decode, int(states[i]))
+    return masks
+
+def battery_state_masks(states):
+    ''' Decodes an array of battery status words at once
+
+    :param states: Raw values of "Battery status", any shape
+    :returns: A uint32 array of EPBatteryFlag bits, e.g. test for HOT with
+        masks & EPBatteryFlag.HOT
+    '''
+    from pyepsolartracer.client import _decode_battery_state
+    return _state_masks(_decode_battery_state, states)
+
+def charger_state_masks(states):
+    ''' Decodes an array of charging equipment status words at once
+
+    :param states: Raw values of "Charging equipment status", any shape
+    :returns: A uint32 array of EPChargerFlag bits
+    '''
+    from pyepsolartracer.client import _decode_charger_state
+    return _state_masks(_decode_charger_state, states)
+
+
+def decode_block(block, words):
+    ''' Decodes raw words of a ReadBlock into a dict of arrays
+
+    :param block: The ReadBlock describing the layout of the words
+    :param words: The raw words, (count,) or (n, count)
+    :returns: A dict of register name to scaled values
+    '''
+    return BlockDecoder.for_block(block).decode(words)
+
+__all__ = [
+    "BlockDecoder",
+    "decode_block",
+    "battery_state_masks",
+    "charger_state_masks",
+]
@@ -0,0 +1,237 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Block read and write planning: registers sitting close to each other are
+# fetched or written in one Modbus transaction instead of one transaction
+# per register
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+from pyepsolartracer.registers import aliasesOf, Value, \
+    COIL, DISCRETE_INPUT, INPUT_REGISTER, HOLDING_REGISTER
+
+import struct
+
+# Modbus allows up to 125 registers in one read, stay well below that
+DEFAULT_MAX_SPAN = 64
+# Number of unused addresses tolerated between two registers of a block
+DEFAULT_MAX_GAP = 8
+# The same for coils and discrete inputs; the addresses between the documented
+# ones may be rejected by the device, which would fail the whole block
+DEFAULT_MAX_BIT_GAP = 0
+# Modbus allows up to 123 registers in one write
+MAX_WRITE_SPAN = 123
+
+
+# compiled formats of block payloads by number of words: big endian, signed
+_formats = {}
+
+def _payload_format(count):
+    format = _formats.get(count)
+    if format is None:
+        format = _formats[count] = struct.Struct('>%dh' % count)
+    return format
+
+
+class ReadBlock:
+    ''' A range of addresses of one kind, read in a single transaction
+    '''
+
+    def __init__(self, kind, address, count, registers):
+        self.kind = kind
+        self.address = address
+        self.count = count
+        self.registers = registers
+
+    def complete(self, response):
+        ''' Checks whether a response carries the data of the whole block
+        '''
+        if self.kind in (COIL, DISCRETE_INPUT):
+            return hasattr(response, "bits") and len(response.bits) >= self.count
+        payload = getattr(response, "payload", None)
+        if payload is not None:
+            return len(payload) >= 2 * self.count
+        return hasattr(response, "registers") and len(response.registers) >= self.count
+
+    def decode(self, response):
+        ''' Decodes the values of all registers of the block
+
+        Responses carrying the raw bytes of their data as payload (those of
+        RtuClient) are decoded by decode_payload, without word lists.
+
+        :param response: The response to the block read
+        :returns: A list of Values, in the order of self.registers
+        '''
+        if not self.complete(response):
+            return [reg.decode(None) for reg in self.registers]
+        if self.kind in (COIL, DISCRETE_INPUT):
+            # one bit per address, padded to whole bytes
+            bits = response.bits
+            address = self.address
+            return [Value(reg, bits[reg.address - address]) for reg in self.registers]
+        payload = getattr(response, "payload", None)
+        if payload is not None:
+            return self.decode_payload(payload)
+        words = response.registers
+        values = []
+        for reg in self.registers:
+            offset = reg.address - self.address
+            values.append(reg.decode_words(words[offset:offset + reg.size]))
+        return values
+
+    def decode_payload(self, payload):
+        ''' Decodes the values of all registers from the data bytes of a response
+
+        All words are unpacked at once as signed numbers; 32 bit values take
+        their sign from the high word.
+
+        :param payload: The data bytes, 2 per register, any buffer (bytes, memoryview)
+        :returns: A list of Values, in the order of self.registers
+        '''
+        words = _payload_format(self.count).unpack_from(payload)
+        address = self.address
+        values = []
+        for reg in self.registers:
+            offset = reg.address - address
+            if reg.size == 1:
+                values.append(Value(reg, words[offset]))
+                continue
+            rawvalue = words[offset + reg.size - 1]
+            for i in range(reg.size - 2, -1, -1):
+                rawvalue = (rawvalue << 16) | (words[offset + i] & 0xffff)
+            values.append(Value(reg, rawvalue))
+        return values
+
+    def __str__(self):
+        return str({ 'kind': self.kind, 'address': self.address, 'count': self.count})
+
+
+def plan_reads(registers, max_span = DEFAULT_MAX_SPAN, max_gap = DEFAULT_MAX_GAP, avoid = None,
+               max_bit_gap = DEFAULT_MAX_BIT_GAP, bridge = None):
+    ''' Groups registers into as few block reads as possible
+
+    Registers are grouped by kind and sorted by address; a block is extended
+    as long as it stays within max_span addresses and the hole before the
+    next register is not larger than max_gap. Coils and discrete inputs
+    are grouped the same way, counted in bits, with max_bit_gap instead of
+    max_gap. The L and H halves of 32 bit values are always read together
+    with the other half.
+
+    :param registers: The registers to read
+    :param max_span: The maximum number of addresses covered by one block
+    :param max_gap: The maximum number of unused addresses inside a block
+    :param avoid: (kind, address) pairs a hole must not cover, e.g.
+        addresses the device does not answer
+    :param max_bit_gap: The maximum number of unused addresses inside a
+        block of coils or discrete inputs
+    :param bridge: (kind, address) pairs known to be answered, a hole made
+        only of them is read whatever its size
+    :returns: A list of ReadBlocks
+    '''
+    byKind = {}
+    seen = set()
+    for reg in registers:
+        if id(reg) in seen:
+            continue
+        seen.add(id(reg))
+        byKind.setdefault(reg.kind, []).append(reg)
+
+    blocks = []
+    for kind in (COIL, DISCRETE_INPUT, INPUT_REGISTER, HOLDING_REGISTER):
+        if kind not in byKind:
+            continue
+        gap = max_bit_gap if kind in (COIL, DISCRETE_INPUT) else max_gap
+        current = None
+        for start, end, reg in sorted((_span(r) + (r,) for r in byKind[kind]),
+                                      key = lambda t: (t[0], -t[1])):
+            if current is not None:
+                current_end = current.address + current.count
+                if (start - current_end <= gap or
+                        (bridge and all((kind, a) in bridge for a in range(current_end, start)))) and \
+                        max(end, current_end) - current.address <= max_span and \
+                        not (avoid and any((kind, a) in avoid for a in range(current_end, start))):
+                    current.registers.append(reg)
+                    current.count = max(end, current_end) - current.address
+                    continue
+            current = ReadBlock(kind, start, end - start, [reg])
+            blocks.append(current)
+    return blocks
+
+class WriteBlock:
+    ''' Consecutive addresses of one kind, written in a single transaction
+    '''
+
+    def __init__(self, kind, address, words, registers):
+        self.kind = kind
+        self.address = address
+        self.words = words
+        self.registers = registers
+
+    @property
+    def count(self):
+        return len(self.words)
+
+    def __str__(self):
+        return str({ 'kind': self.kind, 'address': self.address, 'count': self.count})
+
+
+def plan_writes(values, max_span = MAX_WRITE_SPAN):
+    ''' Groups register values into as few block writes as possible
+
+    Holding registers are sorted by address and written together as long
+    as their addresses follow each other without a hole, since a write
+    cannot skip addresses. Coils are written one per block.
+
+    :param values: (register, scaled value) pairs
+    :param max_span: The maximum number of registers written in one block
+    :returns: A list of WriteBlocks
+    :raises ValueError: For registers that cannot be written, or for two
+        values ending up in the same word (e.g. a 32 bit value and its halves)
+    '''
+    words = {}
+    owners = {}
+    for reg, value in values:
+        if reg.is_input_register() or reg.is_discrete_input():
+            raise ValueError("Cannot write " + reg.kind + " " + repr(reg.name))
+        for i, word in enumerate(reg.encode_words(value)):
+            key = (reg.kind, reg.address + i)
+            if key in words and words[key] != word:
+                raise ValueError("Conflicting values for address " + hex(reg.address + i))
+            words[key] = word
+            owners.setdefault(key, [])
+            if reg not in owners[key]:
+                owners[key].append(reg)
+
+    blocks = []
+    current = None
+    for kind, address in sorted(words, key = lambda key: (key[0] != COIL, key[1])):
+        key = (kind, address)
+        if current is not None and kind == HOLDING_REGISTER and current.kind == kind and \
+                current.address + current.count == address and current.count < max_span:
+            current.words.append(words[key])
+        else:
+            current = WriteBlock(kind, address, [words[key]], [])
+            blocks.append(current)
+        for reg in owners[key]:
+            if reg not in current.registers:
+                current.registers.append(reg)
+    return blocks
+
+def _span(register):
+    ''' Returns the addresses that have to be read for a register
+
+    L and H halves of a 32 bit value are always read with the whole
+    value, so all three registers are served by the same words.
+    '''
+    combined = aliasesOf(register)[0]
+    return (combined.address, combined.address + combined.size)
+
+__all__ = [
+    "ReadBlock",
+    "WriteBlock",
+    "plan_reads",
+    "plan_writes",
+]
@@ -0,0 +1,201 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Several controllers daisy-chained on one RS-485 line share one serial port.
+# The scheduler owns that port and runs the jobs of all units one at a time.
+
+from pyepsolartracer.client import EPsolarTracerClient
+
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import threading
+import time
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+
+def interframe_gap(baudrate):
+    ''' Returns the Modbus RTU silent interval (t3.5) in seconds
+
+    Above 19200 baud the specification fixes it at 1.75 ms, below it is
+    the time of 3.5 characters of 11 bits.
+    '''
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * 11 / baudrate
+
+
+def _baudrate(serialclient):
+    ''' Returns the baud rate of a pymodbus serial client or an RtuClient, None if unknown
+    '''
+    params = getattr(serialclient, 'params', None)
+    baudrate = getattr(params, 'baudrate', None)
+    if baudrate is None:
+        baudrate = getattr(serialclient, 'baudrate', None)
+    return baudrate
+
+
+class BusScheduler:
+    ''' Runs read and write jobs for many units over one serial connection
+
+    Every unit has its own job queue. The worker takes one job from each
+    unit with pending work in turn, so a unit with many queued jobs delays
+    the others by at most one job. Between two jobs the bus is kept silent
+    for at least the inter-frame gap; the transactions within one job are
+    spaced by the serial client, as for a client on its own.
+    '''
+
+    def __init__(self, serialclient = None, gap = None, metrics = None, **kwargs):
+        ''' Initialize a scheduler for one bus
+
+        :param serialclient: The shared modbus client, created from kwargs if None
+        :param gap: Silence between jobs in seconds, t3.5 of the baud rate of
+            the serial client by default
+        :param metrics: An optional TransactionMetrics shared by the clients of all units
+        '''
+        if serialclient == None:
+            from pymodbus.client import ModbusSerialClient as ModbusClient
+            port = kwargs.get('port', '/dev/ttyXRUSB0')
+            baudrate = kwargs.get('baudrate', 115200)
+            serialclient = ModbusClient(method = 'rtu', port = port, baudrate = baudrate, kwargs = kwargs)
+        self.serialclient = serialclient
+        if gap is None:
+            baudrate = _baudrate(serialclient)
+            if baudrate is None:
+                raise ValueError("Cannot tell the baud rate of " + repr(serialclient) + ", pass gap")
+            gap = interframe_gap(baudrate)
+        self.gap = gap
+        self.metrics = metrics
+        self._clients = {}
+        self._queues = OrderedDict()
+        self._condition = threading.Condition()
+        self._last_end = 0.0
+        self._thread = None
+        self._running = False
+
+    def client(self, unit):
+        ''' Returns a client for one unit talking over the shared connection
+
+        The client must only be used from jobs run by this scheduler.
+        '''
+        if unit not in self._clients:
+            self._clients[unit] = EPsolarTracerClient(unit = unit, serialclient = self.serialclient,
+                                                      metrics = self.metrics)
+        return self._clients[unit]
+
+    def submit(self, unit, job, *args):
+        ''' Queues a job for a unit
+
+        :param unit: The modbus unit id
+        :param job: A callable, called as job(client, *args) with the client of the unit
+        :returns: A concurrent.futures.Future for the result of the job
+        '''
+        future = Future()
+        with self._condition:
+            self._queues.setdefault(unit, deque()).append((future, job, args))
+            self._condition.notify()
+        return future
+
+    def read_input(self, unit, name):
+        return self.submit(unit, EPsolarTracerClient.read_input, name)
+
+    def read_many(self, unit, names):
+        return self.submit(unit, EPsolarTracerClient.read_many, names)
+
+    def write_output(self, unit, name, value):
+        return self.submit(unit, EPsolarTracerClient.write_output, name, value)
+
+    def write_many(self, unit, values):
+        return self.submit(unit, EPsolarTracerClient.write_many, values)
+
+    def sync_clock(self, unit, when = None):
+        return self.submit(unit, EPsolarTracerClient.sync_clock, when)
+
+    def pending(self):
+        ''' Returns the number of queued jobs over all units
+        '''
+        with self._condition:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def _next_job(self):
+        ''' Takes the next job in round robin order, or None
+        '''
+        for unit in list(self._queues):
+            queue = self._queues[unit]
+            # this unit had its turn, it goes to the end of the line
+            self._queues.move_to_end(unit)
+            if queue:
+                future, job, args = queue.popleft()
+                return unit, future, job, args
+        return None
+
+    def run_once(self):
+        ''' Runs one job in the calling thread
+
+        :returns: True if a job was run, False if there was nothing to do
+        '''
+        with self._condition:
+            entry = self._next_job()
+        if entry is None:
+            return False
+        unit, future, job, args = entry
+        if not future.set_running_or_notify_cancel():
+            return True
+        wait = self._last_end + self.gap - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            future.set_result(job(self.client(unit), *args))
+        except Exception as e:
+            _logger.info("Job for unit " + str(unit) + " failed: " + repr(e))
+            future.set_exception(e)
+        finally:
+            self._last_end = time.monotonic()
+        return True
+
+    def run_pending(self):
+        ''' Runs jobs in the calling thread until all queues are empty
+        '''
+        while self.run_once():
+            pass
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while self._running and not any(self._queues.values()):
+                    self._condition.wait()
+                if not self._running:
+                    return
+            self.run_once()
+
+    def start(self):
+        ''' Starts a worker thread running the queued jobs
+        '''
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target = self._worker, name = "BusScheduler", daemon = True)
+        self._thread.start()
+
+    def stop(self):
+        ''' Stops the worker thread, queued jobs stay queued
+        '''
+        if self._thread is None:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def close(self):
+        self.stop()
+        return self.serialclient.close()
+
+__all__ = [
+    "BusScheduler",
+    "interframe_gap",
+]
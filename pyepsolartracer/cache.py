@@ -0,0 +1,99 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Read cache for the client: rated data never changes, settings only when we
+# write them, so there is no need to ask the device every time
+
+from pyepsolartracer.registers import aliasesOf
+
+import time
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+# Time to live in seconds per address range [start, end), None never expires,
+# 0 disables caching
+DEFAULT_TTLS = [
+    (0x0000, 0x1000, 0),     # coils
+    (0x1000, 0x3000, 1),     # discrete inputs
+    (0x3000, 0x3100, None),  # rated data
+    (0x3100, 0x3300, 1),     # real-time data and status
+    (0x3300, 0x331B, 60),    # statistical parameters
+    (0x331B, 0x331F, 1),     # battery current and temperatures, real-time
+    (0x331F, 0x3400, 60),    # statistical parameters
+    (0x9000, 0x9013, None),  # settings, invalidated when written
+    (0x9013, 0x9016, 0),     # real time clock, runs on its own
+    (0x9016, 0x10000, None), # settings, invalidated when written
+]
+
+
+class ReadCache:
+    ''' Time based cache of register Values
+    '''
+
+    def __init__(self, ttls = DEFAULT_TTLS, overrides = None, clock = time.monotonic):
+        ''' Initialize a cache
+
+        :param ttls: A list of (start, end, ttl) address ranges
+        :param overrides: A dict of register name to ttl, taking precedence over ttls
+        :param clock: The time source, in seconds
+        '''
+        self.ttls = list(ttls)
+        self.overrides = dict(overrides or {})
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+    def ttl(self, register):
+        ''' Returns the time to live of a register, None for never expiring
+        '''
+        if register.name in self.overrides:
+            return self.overrides[register.name]
+        for start, end, ttl in self.ttls:
+            if start <= register.address < end:
+                return ttl
+        return 0
+
+    def get(self, register):
+        ''' Returns the cached Value of a register, or None if there is none
+        '''
+        entry = self._entries.get(register.name)
+        if entry is not None:
+            value, expires = entry
+            if expires is None or self.clock() < expires:
+                self.hits += 1
+                return value
+            del self._entries[register.name]
+        self.misses += 1
+        return None
+
+    def put(self, value):
+        ''' Stores a freshly read Value
+        '''
+        if value.value is None:
+            return
+        ttl = self.ttl(value.register)
+        if ttl == 0:
+            return
+        expires = None if ttl is None else self.clock() + ttl
+        self._entries[value.register.name] = (value, expires)
+
+    def invalidate(self, register = None):
+        ''' Drops a register and the registers sharing its words, or everything
+        '''
+        if register is None:
+            self._entries.clear()
+            return
+        for reg in aliasesOf(register):
+            self._entries.pop(reg.name, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+__all__ = [
+    "ReadCache",
+    "DEFAULT_TTLS",
+]
@@ -0,0 +1,125 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Change-only publishing: passes on only the values that moved by more than
+# a deadband since they were last passed on, plus every value again after a
+# heartbeat interval, so consumers are not flooded with repeated values.
+
+from pyepsolartracer.registers import V, A, W, C, PC, KWH
+from pyepsolartracer import registers as registertable
+from pyepsolartracer.poll import Sink
+
+from array import array
+import math
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+# (absolute, relative) deadbands by unit, registers of other units (states,
+# settings, counters, coils) are passed on at any change
+DEFAULT_DEADBANDS = {
+    V: (0.05, 0.0),
+    A: (0.05, 0.0),
+    W: (1.0, 0.01),
+    C: (0.5, 0.0),
+    PC: (1.0, 0.0),
+    KWH: (0.01, 0.0),
+}
+# seconds after which a value is passed on even if it did not change
+DEFAULT_HEARTBEAT = 300
+
+
+class ChangeFilter:
+    ''' Keeps the last passed on value of every register and drops repeats
+
+    A value is passed on when it differs from the last passed on value by
+    at least max(absolute, relative * |last value|), when it becomes None
+    or stops being None, or when it was last passed on heartbeat seconds
+    ago. The state is kept in arrays indexed by Register.index.
+    '''
+
+    def __init__(self, deadbands = None, overrides = None, heartbeat = DEFAULT_HEARTBEAT):
+        ''' Initialize a change filter
+
+        :param deadbands: (absolute, relative) deadbands by Unit, DEFAULT_DEADBANDS if None
+        :param overrides: (absolute, relative) deadbands by register name
+        :param heartbeat: Seconds after which unchanged values are passed on, None for never
+        '''
+        self.deadbands = dict(DEFAULT_DEADBANDS if deadbands is None else deadbands)
+        self.overrides = dict(overrides or {})
+        self.heartbeat = heartbeat
+        size = len(registertable.registers) + len(registertable.coils)
+        self._last = array('d', [math.nan] * size)
+        # -inf: never passed on, the first value always is
+        self._sent = array('d', [-math.inf] * size)
+        self._absolute = array('d', [0.0] * size)
+        self._relative = array('d', [0.0] * size)
+        for reg in registertable.registers + registertable.coils:
+            absolute, relative = self.overrides.get(reg.name, self.deadbands.get(reg.unit, (0.0, 0.0)))
+            self._absolute[reg.index] = absolute
+            self._relative[reg.index] = relative
+
+    def changed(self, timestamp, value):
+        ''' Checks a single value, remembering it if it is to be passed on
+        '''
+        i = value.register.index
+        new = math.nan if value.value is None else float(value.value)
+        last = self._last[i]
+        if self.heartbeat is not None and timestamp - self._sent[i] >= self.heartbeat:
+            pass
+        elif math.isnan(new) or math.isnan(last):
+            if math.isnan(new) == math.isnan(last):
+                return False
+        else:
+            difference = abs(new - last)
+            if difference == 0:
+                return False
+            # a bit of slack for scaled values, 13.85 - 13.80 is not quite 0.05
+            band = max(self._absolute[i], self._relative[i] * abs(last)) - 1e-9
+            if difference < band:
+                return False
+        self._last[i] = new
+        self._sent[i] = timestamp
+        return True
+
+    def filter(self, timestamp, values):
+        ''' Returns the Values that are to be passed on
+        '''
+        return [value for value in values if self.changed(timestamp, value)]
+
+    def reset(self):
+        ''' Forgets all values, the next ones are all passed on
+        '''
+        for i in range(len(self._last)):
+            self._last[i] = math.nan
+            self._sent[i] = -math.inf
+
+
+class ChangeSink(Sink):
+    ''' Poller sink passing only changed values on to other sinks
+
+    Cycles without any change are not passed on at all.
+    '''
+
+    def __init__(self, sinks, change_filter = None):
+        self.sinks = list(sinks)
+        self.filter = change_filter if change_filter is not None else ChangeFilter()
+
+    def write(self, timestamp, values):
+        changes = self.filter.filter(timestamp, values)
+        if not changes:
+            return
+        for sink in self.sinks:
+            sink.write(timestamp, changes)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+__all__ = [
+    "ChangeFilter",
+    "ChangeSink",
+    "DEFAULT_DEADBANDS",
+]
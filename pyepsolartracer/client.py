@@ -1,11 +1,15 @@
 # -*- coding: iso-8859-15 -*-
 
-# import the server implementation
-from pymodbus.client import ModbusSerialClient as ModbusClient
-from pymodbus.mei_message import *
-from pyepsolartracer.registers import registerByName
+# pymodbus is only imported when a connection is made, see EPsolarTracerClient
+from pyepsolartracer.registers import registerByName, aliasesOf, Value
+from pyepsolartracer.metrics import outcome, EXCEPTION, TIMEOUT
+from pyepsolartracer.blocks import plan_reads, plan_writes, \
+    COIL, DISCRETE_INPUT, INPUT_REGISTER, \
+    DEFAULT_MAX_SPAN, DEFAULT_MAX_GAP, DEFAULT_MAX_BIT_GAP
 
-from enum import IntEnum
+from enum import IntEnum, IntFlag
+import datetime
+import time
 
 #---------------------------------------------------------------------------#
 # Logging
@@ -52,15 +56,223 @@ EPChargerState = IntEnum('EPChargerState', [
 ], start=0)
 
 
+# The same states as bitsets, one bit per state (1 << state), to test and
+# combine them with plain integer operations
+EPBatteryFlag = IntFlag('EPBatteryFlag', [(state.name, 1 << state) for state in EPBatteryState])
+EPChargerFlag = IntFlag('EPChargerFlag', [(state.name, 1 << state) for state in EPChargerState])
+
+# decoded states by register value, filled as values come up
+_battery_states = {}
+_charger_states = {}
+_battery_flags = {}
+_charger_flags = {}
+
+
+def parse_battery_state(state):
+    """Returns a list of 1-3 EPChargerState error codes, or [NORMAL] in case there are no errors"""
+
+    states = _battery_states.get(state)
+    if states is None:
+        states = tuple(_decode_battery_state(state))
+        if 0 <= state <= 0xFFFF:
+            _battery_states[state] = states
+    return list(states)
+
+def battery_state_flags(state):
+    """Returns the states of parse_battery_state as one EPBatteryFlag"""
+
+    flags = _battery_flags.get(state)
+    if flags is None:
+        flags = EPBatteryFlag(sum(1 << member for member in set(parse_battery_state(state))))
+        if 0 <= state <= 0xFFFF:
+            _battery_flags[state] = flags
+    return flags
+
+def _decode_battery_state(state):
+    """Decodes a battery state bit by bit, see parse_battery_state"""
+
+    output = []
+
+    # hopefully the most common case
+    if state == 0:
+        output.append(EPBatteryState.NORMAL)
+        return output
+    # else we have errors, so let's decode the register
+
+    # if the value is larger than the register length
+    if state & (~0xFFFF) != 0:
+        output.append(EPBatteryState.INVALID_VALUE)
+
+    # bits 0-3
+    first_val = state & 0xF
+    if first_val == 0:
+        # no error code here
+        pass
+    elif first_val > 4 or first_val < 0:
+        # something went wrong
+        output.append(EPBatteryState.INVALID_VALUE)
+    else:
+        output.append(EPBatteryState(first_val))
+    # bits 4-7
+    second_val = (state >> 4) & 0xF
+    if second_val == 0:
+        # no error code here
+        pass
+    elif second_val > 2 or second_val < 0:
+        output.append(EPBatteryState.INVALID_VALUE)
+    else:
+        # + 4 gets us to HOT/COLD in the enum
+        output.append(EPBatteryState(second_val + 4))
+    # bit 8
+    if state & 0x100:
+        output.append(EPBatteryState.INTERNAL_RESISTANCE_ABNORMAL)
+    # bit 15
+    if state & 0x8000:
+        output.append(EPBatteryState.RATED_VOLTAGE_WRONG)
+
+    # somehow, no error was detected, but it's also not 0?
+    if len(output) == 0:
+        output.append(EPBatteryState.INVALID_VALUE)
+
+    return output
+
+def parse_charger_state(state):
+    """Returns a list of EPChargerState codes:
+
+    First is always charging state (or INVALID_VALUE); any following EPChargerStates are non-normal states / error codes
+    """
+
+    states = _charger_states.get(state)
+    if states is None:
+        states = tuple(_decode_charger_state(state))
+        if 0 <= state <= 0xFFFF:
+            _charger_states[state] = states
+    return list(states)
+
+def charger_state_flags(state):
+    """Returns the states of parse_charger_state as one EPChargerFlag"""
+
+    flags = _charger_flags.get(state)
+    if flags is None:
+        flags = EPChargerFlag(sum(1 << member for member in set(parse_charger_state(state))))
+        if 0 <= state <= 0xFFFF:
+            _charger_flags[state] = flags
+    return flags
+
+def _decode_charger_state(state):
+    """Decodes a charger state bit by bit, see parse_charger_state"""
+
+    output = []
+
+    # if the value is larger than the register length
+    if state & (~0xFFFF) != 0:
+        output.append(EPChargerState.INVALID_VALUE)
+
+    # bit 2-3: charging state
+    charging_state = (state & (3 << 2)) >> 2
+    output.append(EPChargerState(charging_state))
+    # bit 0: running/standby
+    if state & 1 == 0:
+        output.append(EPChargerState.STANDBY)
+    # bit 1: general fault
+    if state & (1 << 1) != 0:
+        output.append(EPChargerState.FAULT)
+    # bit 4: pv short
+    if state & (1 << 4) != 0:
+        output.append(EPChargerState.SHORT_PV)
+    # bit 7: load mosfet short - how is this different from load short? internal error?
+    if state & (1 << 7) != 0:
+        output.append(EPChargerState.SHORT_LOAD_FET)
+    # bit 8: load short
+    if state & (1 << 8) != 0:
+        output.append(EPChargerState.SHORT_LOAD)
+    # bit 9: load oc
+    if state & (1 << 9) != 0:
+        output.append(EPChargerState.OVERCURRENT_LOAD)
+    # bit 10: input oc
+    if state & (1 << 10) != 0:
+        output.append(EPChargerState.OVERCURRENT_INPUT)
+    # bit 11: anti-reverse-fet short
+    if state & (1 << 11) != 0:
+        output.append(EPChargerState.SHORT_ANTIREVERSE)
+    # bit 12: anti-reverse-fet short or(?) charging fet short
+    # TODO: figure out how this works for our controller, and merge 11-13 with some logic?
+    if state & (1 << 12) != 0:
+        output.append(EPChargerState.SHORT_CHARGING_OR_ANTIREVERSE)
+    # bit 13: charging mostfet short
+    if state & (1 << 13) != 0:
+        output.append(EPChargerState.SHORT_CHARGING_FET)
+    # bit 14-15: input voltage status
+    input_voltage_state = (state & (3 << 14)) >> 14
+    if input_voltage_state == 0:
+        # normal
+        pass
+    else:
+        # map input voltage errors 1-3 to INPUT_NOT_CONNECTED/INPUT_OVERVOLT/INPUT_VOLTAGE_ERROR
+        output.append(EPChargerState(EPChargerState.INPUT_NOT_CONNECTED - 1
+                                        + input_voltage_state))
+
+    return output
+
+
+def clock_values(when):
+    """Returns the real time clock registers for a datetime, to pass to write_many"""
+
+    return {
+        "Real time clock 1": when.second | (when.minute << 8),
+        "Real time clock 2": when.hour | (when.day << 8),
+        "Real time clock 3": when.month | ((when.year - 2000) << 8),
+    }
+
+def parse_clock(values):
+    """Returns the datetime of the three real time clock Values, or None if one is missing"""
+
+    words = [value.value for value in values]
+    if None in words:
+        return None
+    words = [int(word) & 0xffff for word in words]
+    try:
+        return datetime.datetime(2000 + (words[2] >> 8), words[2] & 0xff, words[1] >> 8,
+                                 words[1] & 0xff, words[0] >> 8, words[0] & 0xff)
+    except ValueError:
+        _logger.info("Invalid clock " + repr(words))
+        return None
+
+def _written(response):
+    return response is not None and hasattr(response, "isError") and not response.isError()
+
+# the real time clock registers, in the order of parse_clock
+CLOCK = ["Real time clock 1", "Real time clock 2", "Real time clock 3"]
+
+
 class EPsolarTracerClient:
     ''' EPsolar Tracer client
     '''
 
-    def __init__(self, unit = 1, serialclient = None, **kwargs):
+    def __init__(self, unit = 1, serialclient = None, max_span = DEFAULT_MAX_SPAN, max_gap = DEFAULT_MAX_GAP, cache = None, capabilities = None, metrics = None, retries = 0, max_bit_gap = DEFAULT_MAX_BIT_GAP, **kwargs):
         ''' Initialize a serial client instance
+
+        :param max_span: The maximum number of addresses read in one block by read_many
+        :param max_gap: The maximum number of unused addresses inside one block
+        :param max_bit_gap: The same for coils and discrete inputs
+        :param cache: An optional ReadCache answering reads of fresh values
+        :param capabilities: An optional CapabilityMap, registers it marks as
+            unsupported are not read but returned without value, holes it
+            marks as answered are read to save transactions
+        :param metrics: An optional TransactionMetrics recording every transaction
+        :param retries: How often a transaction without answer is repeated
         '''
         self.unit = unit
+        self.metrics = metrics
+        self.retries = retries
+        self.max_span = max_span
+        self.max_gap = max_gap
+        self.max_bit_gap = max_bit_gap
+        self.cache = cache
+        self.capabilities = capabilities
         if serialclient == None:
+            # import the server implementation
+            from pymodbus.client import ModbusSerialClient as ModbusClient
             port = kwargs.get('port', '/dev/ttyXRUSB0')
             baudrate = kwargs.get('baudrate', 115200)
             self.client = ModbusClient(method = 'rtu', port = port, baudrate = baudrate, kwargs = kwargs)
@@ -79,146 +291,181 @@ class EPsolarTracerClient:
         return self.client.close()
 
     def read_device_info(self):
-        request = ReadDeviceInformationRequest (unit = self.unit)
+        from pymodbus.mei_message import ReadDeviceInformationRequest
+        request = ReadDeviceInformationRequest (slave = self.unit)
         response = self.client.execute(request)
         return response
 
-    def parse_battery_state(self, state):
-        """Returns a list of 1-3 EPChargerState error codes, or [NORMAL] in case there are no errors"""
-
-        output = []
-
-        # hopefully the most common case
-        if state == 0:
-            output.append(EPBatteryState.NORMAL)
-            return output
-        # else we have errors, so let's decode the register
-
-        # if the value is larger than the register length
-        if state & (~0xFFFF) != 0:
-            output.append(EPBatteryState.INVALID_VALUE)
-
-        # bits 0-3
-        first_val = state & 0xF
-        if first_val == 0:
-            # no error code here
-            pass
-        elif first_val > 4 or first_val < 0:
-            # something went wrong
-            output.append(EPBatteryState.INVALID_VALUE)
-        else:
-            output.append(EPBatteryState(first_val))
-        # bits 4-7
-        second_val = (state >> 4) & 0xF
-        if second_val == 0:
-            # no error code here
-            pass
-        elif second_val > 2 or second_val < 0:
-            output.append(EPBatteryState.INVALID_VALUE)
-        else:
-            # + 4 gets us to HOT/COLD in the enum
-            output.append(EPBatteryState(second_val + 4))
-        # bit 8
-        if state & 0x100:
-            output.append(EPBatteryState.INTERNAL_RESISTANCE_ABNORMAL)
-        # bit 15
-        if state & 0x8000:
-            output.append(EPBatteryState.RATED_VOLTAGE_WRONG)
-
-        # somehow, no error was detected, but it's also not 0?
-        if len(output) == 0:
-            output.append(EPBatteryState.INVALID_VALUE)
+    # the state decoders are shared with the asyncio client
+    parse_battery_state = staticmethod(parse_battery_state)
+    parse_charger_state = staticmethod(parse_charger_state)
+    battery_state_flags = staticmethod(battery_state_flags)
+    charger_state_flags = staticmethod(charger_state_flags)
 
-        return output
+    def _transact(self, function, count, request, *args):
+        ''' Runs request(*args), records it in the metrics and repeats it
+        up to retries times as long as there is no answer
+        '''
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            response = request(*args)
+            if self.metrics is not None:
+                self.metrics.record(self.unit, function, count, time.perf_counter() - start, response, attempt > 0)
+            if outcome(response) != TIMEOUT:
+                break
+        return response
 
-    def parse_charger_state(self, state):
-        """Returns a list of EPChargerState codes:
-
-        First is always charging state (or INVALID_VALUE); any following EPChargerStates are non-normal states / error codes
-        """
-
-        output = []
-
-        # if the value is larger than the register length
-        if state & (~0xFFFF) != 0:
-            output.append(EPChargerState.INVALID_VALUE)
-
-        # bit 2-3: charging state
-        charging_state = (state & (3 << 2)) >> 2
-        output.append(EPChargerState(charging_state))
-        # bit 0: running/standby
-        if state & 1 == 0:
-            output.append(EPChargerState.STANDBY)
-        # bit 1: general fault
-        if state & (1 << 1) != 0:
-            output.append(EPChargerState.FAULT)
-        # bit 4: pv short
-        if state & (1 << 4) != 0:
-            output.append(EPChargerState.SHORT_PV)
-        # bit 7: load mosfet short - how is this different from load short? internal error?
-        if state & (1 << 7) != 0:
-            output.append(EPChargerState.SHORT_LOAD_FET)
-        # bit 8: load short
-        if state & (1 << 8) != 0:
-            output.append(EPChargerState.SHORT_LOAD)
-        # bit 9: load oc
-        if state & (1 << 9) != 0:
-            output.append(EPChargerState.OVERCURRENT_LOAD)
-        # bit 10: input oc
-        if state & (1 << 10) != 0:
-            output.append(EPChargerState.OVERCURRENT_INPUT)
-        # bit 11: anti-reverse-fet short
-        if state & (1 << 11) != 0:
-            output.append(EPChargerState.SHORT_ANTIREVERSE)
-        # bit 12: anti-reverse-fet short or(?) charging fet short
-        # TODO: figure out how this works for our controller, and merge 11-13 with some logic?
-        if state & (1 << 12) != 0:
-            output.append(EPChargerState.SHORT_CHARGING_OR_ANTIREVERSE)
-        # bit 13: charging mostfet short
-        if state & (1 << 13) != 0:
-            output.append(EPChargerState.SHORT_CHARGING_FET)
-        # bit 14-15: input voltage status
-        input_voltage_state = (state & (3 << 14)) >> 14
-        if input_voltage_state == 0:
-            # normal
-            pass
+    def _read(self, kind, address, count):
+        ''' Issues a single read transaction
+        '''
+        if kind == COIL:
+            return self._transact(1, count, self.client.read_coils, address, count, self.unit)
+        elif kind == DISCRETE_INPUT:
+            return self._transact(2, count, self.client.read_discrete_inputs, address, count, self.unit)
+        elif kind == INPUT_REGISTER:
+            return self._transact(4, count, self.client.read_input_registers, address, count, self.unit)
         else:
-            # map input voltage errors 1-3 to INPUT_NOT_CONNECTED/INPUT_OVERVOLT/INPUT_VOLTAGE_ERROR
-            output.append(EPChargerState(EPChargerState.INPUT_NOT_CONNECTED - 1
-                                            + input_voltage_state))
+            return self._transact(3, count, self.client.read_holding_registers, address, count, self.unit)
 
-        return output
+    def read_block(self, block):
+        ''' Reads a ReadBlock, returns the raw response
+        '''
+        return self._read(block.kind, block.address, block.count)
+
+    def _supported(self, register):
+        return self.capabilities is None or self.capabilities.supports(register)
+
+    def _remember(self, values):
+        if self.cache is not None:
+            for value in values:
+                self.cache.put(value)
 
     def read_input(self, name):
         register = registerByName(name)
-        if register.is_coil():
-            response = self.client.read_coils(address=register.address, count=register.size, slave = self.unit)
-        elif register.is_discrete_input():
-            response = self.client.read_discrete_inputs(address=register.address, count=register.size, slave = self.unit)
-        elif register.is_input_register():
-            response = self.client.read_input_registers(address=register.address, count=register.size, slave = self.unit)
-        else:
-            response = self.client.read_holding_registers(address=register.address, count=register.size, slave = self.unit)
-        return register.decode(response)
+        if not self._supported(register):
+            return Value(register, None)
+        group = [register]
+        if self.cache is not None:
+            value = self.cache.get(register)
+            if value is not None:
+                return value
+            # the other halves come with the same response, keep them as well
+            group = aliasesOf(register)
+        # L/H halves are read with the whole 32 bit value
+        block = plan_reads(group)[0]
+        values = block.decode(self._read(block.kind, block.address, block.count))
+        self._remember(values)
+        return values[block.registers.index(register)]
 
-    def write_output(self, name, value):
-        register = registerByName(name)
-        values = register.encode(value)
-        response = False
-        if register.is_coil():
-            self.client.write_coil(address=register.address, value=values, slave = self.unit)
-            response = True
-        elif register.is_discrete_input():
-            _logger.error("Cannot write discrete input " + repr(name))
-            pass
-        elif register.is_input_register():
-            _logger.error("Cannot write input register " + repr(name))
-            pass
-        else:
-            self.client.write_registers(address=register.address, value=values, slave = self.unit)
-            response = True
+    def read_many(self, names):
+        ''' Reads several registers with as few transactions as possible
+
+        Blocks rejected with an exception response (e.g. because the device
+        does not know an address inside the block) are retried register by
+        register. Blocks without an answer give None for all their registers.
+
+        :param names: The names of the registers to read
+        :returns: A list of Values, in the order of names
+        '''
+        wanted = [registerByName(name) for name in names]
+        values = {}
+        missing = []
+        for reg in wanted:
+            if id(reg) in values:
+                continue
+            cached = self.cache.get(reg) if self.cache is not None else None
+            if cached is not None:
+                values[id(reg)] = cached
+            elif not self._supported(reg):
+                values[id(reg)] = Value(reg, None)
+            else:
+                missing.append(reg)
+        avoid = self.capabilities.unsupported if self.capabilities is not None else None
+        bridge = self.capabilities.answered if self.capabilities is not None else None
+        for block in plan_reads(missing, self.max_span, self.max_gap, avoid, self.max_bit_gap, bridge):
+            response = self._read(block.kind, block.address, block.count)
+            if len(block.registers) > 1 and not block.complete(response) and outcome(response) == EXCEPTION:
+                _logger.info("Block read failed, reading registers one by one " + str(block))
+                for reg in block.registers:
+                    values[id(reg)] = self.read_input(reg.name)
+                continue
+            decoded = block.decode(response)
+            self._remember(decoded)
+            for reg, value in zip(block.registers, decoded):
+                values[id(reg)] = value
+        return [values[id(reg)] for reg in wanted]
+
+    def read_all(self):
+        ''' Reads all known registers and coils
+
+        :returns: A list of Values, registers first, then coils
+        '''
+        from pyepsolartracer.registers import registers, coils
+        return self.read_many([reg.name for reg in registers] + [reg.name for reg in coils])
+
+    def _write(self, block):
+        ''' Issues a single write transaction
+        '''
+        if block.kind == COIL:
+            return self._transact(5, 1, self.client.write_coil, block.address, block.words[0], self.unit)
+        return self._transact(16, block.count, self.client.write_registers, block.address, block.words, self.unit)
+
+    def write_many(self, values):
+        ''' Writes several registers with as few transactions as possible
+
+        Holding registers at consecutive addresses are written by one
+        write_registers call, so values documented to be written together
+        (like the real time clock) are set at once.
+
+        :param values: A dict of register name to scaled value
+        :returns: True if all writes succeeded, False otherwise
+        '''
+        try:
+            blocks = plan_writes([(registerByName(name), value) for name, value in values.items()])
+        except ValueError as e:
+            _logger.error(str(e))
+            return False
+        response = True
+        for block in blocks:
+            if self.cache is not None:
+                for reg in block.registers:
+                    self.cache.invalidate(reg)
+            if not _written(self._write(block)):
+                _logger.error("Write failed " + str(block))
+                response = False
         return response
 
+    def write_output(self, name, value):
+        return self.write_many({name: value})
+
+    def read_clock(self):
+        ''' Reads the real time clock of the controller
+
+        :returns: A datetime, or None if the clock could not be read
+        '''
+        return parse_clock(self.read_many(CLOCK))
+
+    def sync_clock(self, when = None):
+        ''' Sets the real time clock of the controller in one transaction
+
+        :param when: A datetime, the local time by default
+        :returns: True if the clock was set
+        '''
+        if when is None:
+            when = datetime.datetime.now()
+        return self.write_many(clock_values(when))
+
 __all__ = [
     "EPsolarTracerClient",
+    "EPBatteryState",
+    "EPChargerState",
+    "EPBatteryFlag",
+    "EPChargerFlag",
+    "parse_battery_state",
+    "parse_charger_state",
+    "battery_state_flags",
+    "charger_state_flags",
+    "CLOCK",
+    "clock_values",
+    "parse_clock",
 ]
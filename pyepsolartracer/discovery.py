@@ -0,0 +1,201 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Discovery of the registers a controller answers. Not every model and
+# firmware has all registers of the table, and reading a missing one costs
+# an exception or, on some firmware, a whole timeout. The addresses found
+# are kept on disk per model and firmware, clients given the map do not
+# read them any more.
+
+from pyepsolartracer.blocks import plan_reads, DEFAULT_MAX_SPAN, DEFAULT_MAX_GAP
+from pyepsolartracer.registers import aliasesOf
+from pyepsolartracer.metrics import outcome, EXCEPTION
+from pyepsolartracer import registers as registertable
+
+import json
+import os
+import re
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+# holes between coils or discrete inputs tried by discovery, bits are cheap
+DISCOVERY_BIT_GAP = 16
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'pyepsolartracer')
+
+
+class CapabilityMap:
+    ''' The addresses a device does not answer, and the unused addresses
+    between registers it does answer, by kind
+    '''
+
+    def __init__(self, model = None, firmware = None, unsupported = (), answered = ()):
+        ''' Initialize a capability map
+
+        :param model: The product code reported by the device
+        :param firmware: The revision reported by the device
+        :param unsupported: (kind, address) pairs the device does not answer
+        :param answered: (kind, address) pairs of holes between registers
+            the device answers, reads may cover them
+        '''
+        self.model = model
+        self.firmware = firmware
+        self.unsupported = set(unsupported)
+        self.answered = set(answered)
+
+    def supports(self, register):
+        return not any((register.kind, address) in self.unsupported
+                       for address in range(register.address, register.address + register.size))
+
+    def to_dict(self):
+        return {'model': self.model, 'firmware': self.firmware,
+                'unsupported': _by_kind(self.unsupported), 'answered': _by_kind(self.answered)}
+
+    @classmethod
+    def from_dict(cls, description):
+        return cls(description.get('model'), description.get('firmware'),
+                   _pairs(description['unsupported']), _pairs(description.get('answered', {})))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding = 'utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        # write a new file and move it in place, a half written map would be trusted later
+        with open(path + '.tmp', 'w', encoding = 'utf-8') as f:
+            json.dump(self.to_dict(), f, indent = 1)
+            f.write("\n")
+        os.replace(path + '.tmp', path)
+
+
+def _by_kind(pairs):
+    byKind = {}
+    for kind, address in sorted(pairs):
+        byKind.setdefault(kind, []).append(address)
+    return byKind
+
+def _pairs(byKind):
+    return [(kind, address) for kind, addresses in byKind.items() for address in addresses]
+
+
+def device_identity(client):
+    ''' Returns (model, firmware) from the device information, None if not available
+    '''
+    response = client.read_device_info()
+    information = getattr(response, 'information', None)
+    if not information or 1 not in information or 2 not in information:
+        return None
+    return tuple(information[i].decode('ascii', 'replace').strip() for i in (1, 2))
+
+
+def _groups(registers):
+    ''' Splits registers into the groups read together (32 bit values and their halves)
+    '''
+    groups = {}
+    for reg in registers:
+        groups.setdefault(id(aliasesOf(reg)[0]), []).append(reg)
+    return list(groups.values())
+
+def discover(client, registers = None, max_span = DEFAULT_MAX_SPAN, max_gap = DEFAULT_MAX_GAP, retries = 3,
+             max_bit_gap = DISCOVERY_BIT_GAP):
+    ''' Finds the addresses a device does not answer by bisection
+
+    Every block read_many would read is tried; blocks that fail are split
+    in halves until the failing registers are found. When both halves of
+    a failed block are answered, the hole between them is the culprit.
+    An exception response is taken as proof at once, blocks without a
+    usable answer are read again up to retries times first, as that may
+    just be noise on the line. The holes inside answered blocks are kept
+    as answered; coils and discrete inputs are tried with holes of up to
+    max_bit_gap so that clients may bridge them later.
+
+    :param client: The EPsolarTracerClient of the device
+    :param registers: The registers to check, all registers and coils by default
+    :param retries: How often blocks without answer are read again
+    :param max_bit_gap: The largest hole between coils or discrete inputs tried
+    :returns: A CapabilityMap without model and firmware
+    '''
+    if registers is None:
+        registers = registertable.registers + registertable.coils
+    unsupported = set()
+    holes = set()
+
+    def probe(registers):
+        ''' Reads registers, returns True if all were answered
+        '''
+        answered = True
+        for block in plan_reads(registers, max_span, max_gap, unsupported, max_bit_gap):
+            response = client.read_block(block)
+            for attempt in range(retries):
+                if block.complete(response) or outcome(response) == EXCEPTION:
+                    break
+                _logger.debug("No answer, reading again " + str(block))
+                response = client.read_block(block)
+            if block.complete(response):
+                used = set()
+                for reg in block.registers:
+                    used.update(range(reg.address, reg.address + reg.size))
+                holes.update((block.kind, address) for address in range(block.address, block.address + block.count)
+                                if address not in used)
+                continue
+            answered = False
+            groups = _groups(block.registers)
+            if len(groups) == 1:
+                _logger.info("Not supported: " + ", ".join(reg.name for reg in groups[0]))
+                unsupported.update((block.kind, address)
+                                   for address in range(block.address, block.address + block.count))
+                continue
+            half = len(groups) // 2
+            left = [reg for group in groups[:half] for reg in group]
+            right = [reg for group in groups[half:] for reg in group]
+            left_answered = probe(left)
+            right_answered = probe(right)
+            if left_answered and right_answered:
+                end = max(reg.address + reg.size for reg in left)
+                start = min(reg.address for reg in right)
+                unsupported.update((block.kind, address) for address in range(end, start))
+        return answered
+
+    probe(list(registers))
+    return CapabilityMap(unsupported = unsupported, answered = holes - unsupported)
+
+
+def _filename(model, firmware):
+    return re.sub(r'[^A-Za-z0-9._+-]', '_', model + '-' + firmware) + '.json'
+
+def load_capabilities(client, directory = DEFAULT_DIRECTORY, refresh = False):
+    ''' Returns the capability map of a device, discovering it on first use
+
+    Maps are kept in directory, one file per model and firmware. Devices
+    that do not report both are discovered every time.
+
+    :param client: The EPsolarTracerClient of the device
+    :param directory: Where the maps are kept
+    :param refresh: Discover again even if a map is on disk
+    :returns: A CapabilityMap
+    '''
+    identity = device_identity(client)
+    if identity is None:
+        _logger.warning("Device does not identify itself, discovering without cache")
+        return discover(client)
+    path = os.path.join(directory, _filename(*identity))
+    if not refresh and os.path.exists(path):
+        return CapabilityMap.load(path)
+    capabilities = discover(client)
+    capabilities.model, capabilities.firmware = identity
+    capabilities.save(path)
+    return capabilities
+
+__all__ = [
+    "CapabilityMap",
+    "discover",
+    "device_identity",
+    "load_capabilities",
+]
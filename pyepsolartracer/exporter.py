@@ -0,0 +1,256 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Prometheus exporter: a poller keeps a snapshot of the latest values up to
+# date, scrapes are answered from that snapshot and never touch the serial
+# port, however many of them come in. Run it with
+#
+#   python -m pyepsolartracer.exporter --port /dev/ttyXRUSB0 --listen :9810
+
+from pyepsolartracer.client import EPsolarTracerClient, EPBatteryState, EPChargerState, \
+    battery_state_flags, charger_state_flags
+from pyepsolartracer.poll import Poller, Sink
+from pyepsolartracer.metrics import TransactionMetrics
+from pyepsolartracer import registers as registertable
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _label(text):
+    return str(text).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_values(timestamp, values):
+    ''' Renders the values of one poll cycle in the Prometheus text format
+
+    :param timestamp: The time of the cycle, seconds since the epoch
+    :param values: The Values read
+    :returns: The text of the register and state series
+    '''
+    lines = [
+        '# HELP epsolar_register Value of a register of the controller, scaled to its unit',
+        '# TYPE epsolar_register gauge',
+    ]
+    states = {}
+    for value in values:
+        if value.value is None:
+            continue
+        reg = value.register
+        lines.append('epsolar_register{name="%s",address="0x%04x",unit="%s"} %s' % (
+            _label(reg.name), reg.address, _label(reg.unit.symbol), float(value.value)))
+        if reg.name in ("Battery status", "Charging equipment status"):
+            states[reg.name] = int(value.value) & 0xffff
+    if "Battery status" in states:
+        flags = battery_state_flags(states["Battery status"])
+        lines.append('# HELP epsolar_battery_state Decoded battery status, 1 for the states present')
+        lines.append('# TYPE epsolar_battery_state gauge')
+        for state in EPBatteryState:
+            lines.append('epsolar_battery_state{state="%s"} %d' % (state.name, (flags >> state) & 1))
+    if "Charging equipment status" in states:
+        flags = charger_state_flags(states["Charging equipment status"])
+        lines.append('# HELP epsolar_charger_state Decoded charging equipment status, 1 for the states present')
+        lines.append('# TYPE epsolar_charger_state gauge')
+        for state in EPChargerState:
+            lines.append('epsolar_charger_state{state="%s"} %d' % (state.name, (flags >> state) & 1))
+    lines.append('# HELP epsolar_sample_timestamp_seconds Time of the last successful poll')
+    lines.append('# TYPE epsolar_sample_timestamp_seconds gauge')
+    lines.append('epsolar_sample_timestamp_seconds %s' % float(timestamp))
+    return "\n".join(lines) + "\n"
+
+
+def render_health(poller):
+    ''' Renders the counters of a Poller in the Prometheus text format
+    '''
+    lines = [
+        '# HELP epsolar_poll_cycles_total Poll cycles that read values',
+        '# TYPE epsolar_poll_cycles_total counter',
+        'epsolar_poll_cycles_total %d' % poller.cycles,
+        '# HELP epsolar_poll_failures_total Poll cycles that failed',
+        '# TYPE epsolar_poll_failures_total counter',
+        'epsolar_poll_failures_total %d' % poller.failures,
+        '# HELP epsolar_poll_interval_seconds Current time between poll cycles',
+        '# TYPE epsolar_poll_interval_seconds gauge',
+        'epsolar_poll_interval_seconds %s' % float(poller.interval),
+        '# HELP epsolar_up Whether the controller answered at the last poll',
+        '# TYPE epsolar_up gauge',
+        'epsolar_up %d' % (1 if poller.connected else 0),
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def render_transactions(metrics):
+    ''' Renders a TransactionMetrics in the Prometheus text format
+    '''
+    with metrics.lock:
+        stats = sorted(metrics.stats.items())
+    lines = [
+        '# HELP epsolar_transaction_seconds Time from request to response of Modbus transactions',
+        '# TYPE epsolar_transaction_seconds histogram',
+    ]
+    for (unit, function), s in stats:
+        labels = 'unit="%d",function="%d"' % (unit, function)
+        total = 0
+        for bound, count in zip(metrics.buckets + (float('inf'),), s.histogram):
+            total += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append('epsolar_transaction_seconds_bucket{%s,le="%s"} %d' % (labels, le, total))
+        lines.append('epsolar_transaction_seconds_sum{%s} %s' % (labels, s.time))
+        lines.append('epsolar_transaction_seconds_count{%s} %d' % (labels, s.count))
+    for name, attribute, description in [
+            ('epsolar_transaction_exceptions_total', 'exceptions', 'Transactions answered with an exception code'),
+            ('epsolar_transaction_timeouts_total', 'timeouts', 'Transactions without answer'),
+            ('epsolar_transaction_retries_total', 'retries', 'Transactions repeated after no answer'),
+            ('epsolar_bytes_sent_total', 'bytes_sent', 'Bytes of request frames'),
+            ('epsolar_bytes_received_total', 'bytes_received', 'Bytes of response frames')]:
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s counter' % name)
+        for (unit, function), s in stats:
+            lines.append('%s{unit="%d",function="%d"} %d' % (name, unit, function, getattr(s, attribute)))
+    lines.append('# HELP epsolar_bus_utilization Share of the time spent in transactions')
+    lines.append('# TYPE epsolar_bus_utilization gauge')
+    lines.append('epsolar_bus_utilization %s' % metrics.utilization())
+    return "\n".join(lines) + "\n"
+
+
+class Snapshot(Sink):
+    ''' Poller sink keeping the rendered values of the last cycle
+
+    The text is rendered once per cycle, scrapes only copy it.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timestamp = None
+        self.values = []
+        self.text = ""
+
+    def write(self, timestamp, values):
+        text = render_values(timestamp, values)
+        with self.lock:
+            self.timestamp = timestamp
+            self.values = values
+            self.text = text
+
+
+class Exporter:
+    ''' HTTP server answering /metrics from a Snapshot
+    '''
+
+    def __init__(self, snapshot, poller = None, address = ('', 9810), metrics = None):
+        ''' Initialize an exporter
+
+        :param snapshot: The Snapshot to serve
+        :param poller: The Poller filling the snapshot, for its health metrics
+        :param address: The (host, port) to listen on
+        :param metrics: The TransactionMetrics of the clients, if any
+        '''
+        self.snapshot = snapshot
+        self.poller = poller
+        self.transactions = metrics
+        self.scrapes = 0
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = exporter.metrics().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                _logger.debug(format % args)
+
+        self.server = ThreadingHTTPServer(address, Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def metrics(self):
+        ''' Returns the text of a scrape
+        '''
+        with self.snapshot.lock:
+            text = self.snapshot.text
+            self.scrapes += 1
+        if self.poller is not None:
+            text += render_health(self.poller)
+        if self.transactions is not None:
+            text += render_transactions(self.transactions)
+        return text
+
+    def start(self):
+        ''' Serves in a background thread
+        '''
+        self._thread = threading.Thread(target = self.server.serve_forever, name = "Exporter", daemon = True)
+        self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "python -m pyepsolartracer.exporter",
+                                     description = "Export EPsolar Tracer values to Prometheus")
+    parser.add_argument('--port', default = '/dev/ttyXRUSB0', help = "serial port")
+    parser.add_argument('--baudrate', type = int, default = 115200)
+    parser.add_argument('--unit', type = int, default = 1, help = "modbus unit id")
+    parser.add_argument('--timeout', type = float, default = 1, help = "response timeout in seconds")
+    parser.add_argument('--interval', type = float, default = 10, help = "seconds between samples")
+    parser.add_argument('--listen', default = ':9810', help = "host:port to serve /metrics on")
+    parser.add_argument('--verbose', '-v', action = 'store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
+    from pymodbus.client import ModbusSerialClient as ModbusClient
+    serialclient = ModbusClient(method = 'rtu', port = args.port, baudrate = args.baudrate,
+                                stopbits = 1, bytesize = 8, timeout = args.timeout)
+    metrics = TransactionMetrics()
+    client = EPsolarTracerClient(unit = args.unit, serialclient = serialclient, metrics = metrics)
+
+    names = [reg.name for reg in registertable.registers] + [reg.name for reg in registertable.coils]
+    snapshot = Snapshot()
+    poller = Poller(client, names, args.interval, [snapshot])
+    host, _, port = args.listen.rpartition(':')
+    exporter = Exporter(snapshot, poller, (host, int(port)), metrics)
+    exporter.start()
+    try:
+        poller.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        exporter.close()
+        poller.close()
+
+__all__ = [
+    "Exporter",
+    "Snapshot",
+    "render_values",
+    "render_health",
+    "render_transactions",
+]
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Loading of recorded samples into NumPy columns, from the text log written
+# by watch.sh / the poller or from a binary sample store
+
+from pyepsolartracer.store import MAGIC, StoreReader
+
+import calendar
+import datetime
+import re
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+_MONTHS = {name: i + 1 for i, name in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])}
+
+# output of date(1): "Sat Jun  3 14:05:01 BST 2023", the zone name is optional
+_DATE = re.compile(r'^[A-Z][a-z]{2} ([A-Z][a-z]{2}) +(\d{1,2}) (\d\d):(\d\d):(\d\d) (?:\S+ )?(\d{4})$')
+# ISO 8601, e.g. "2023-06-03T14:05:01+01:00"
+_ISODATE = re.compile(r'^\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d\S*$')
+# the number at the start of a value, followed by the unit
+_NUMBER = re.compile(r'-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?')
+
+
+def parse_date(line, utcoffset = None):
+    ''' Parses a date line of a log
+
+    Time zone names of date(1) are ambiguous (BST, IST, ...), so they are
+    ignored: the time is taken as local time, or as UTC plus utcoffset.
+
+    :param line: The line, without line end
+    :param utcoffset: The offset of the logged times from UTC in seconds
+    :returns: Seconds since the epoch, or None if this is not a date line
+    '''
+    match = _DATE.match(line)
+    if match is not None:
+        month, day, hour, minute, second, year = match.groups()
+        fields = (int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second))
+        if utcoffset is None:
+            return time.mktime(fields + (0, 0, -1))
+        return calendar.timegm(fields) - utcoffset
+    if _ISODATE.match(line):
+        when = datetime.datetime.fromisoformat(line)
+        if when.tzinfo is None and utcoffset is not None:
+            when = when.replace(tzinfo = datetime.timezone(datetime.timedelta(seconds = utcoffset)))
+        return when.timestamp()
+    return None
+
+
+def _parse_value(text):
+    if text.startswith('True'):
+        return 1.0
+    if text.startswith('False'):
+        return 0.0
+    match = _NUMBER.match(text)
+    if match is None:
+        # None, a value that could not be read
+        return float('nan')
+    return float(match.group())
+
+
+def load_log(stream, names = None, start = None, end = None, utcoffset = None):
+    ''' Loads a text log into columns
+
+    Every date line starts a new sample, the "name = value" lines after it
+    belong to that sample. Registers missing in a sample are NaN.
+
+    :param stream: An iterable of lines, e.g. an open file
+    :param names: The registers to load, all found in the log by default
+    :param start: Only samples at or after this timestamp
+    :param end: Only samples before this timestamp
+    :param utcoffset: See parse_date
+    :returns: A dict of name to float64 array, plus 'time'
+    '''
+    if np is None:
+        raise ImportError("NumPy is needed to load logs")
+    wanted = None if names is None else set(names)
+    times = []
+    columns = {}
+    sample = None
+    # the same few texts come up over and over again, parse each only once
+    parsed = {}
+    for line in stream:
+        name, separator, text = line.partition(' = ')
+        if separator:
+            if sample is None or (wanted is not None and name not in wanted):
+                continue
+            value = parsed.get(text)
+            if value is None:
+                value = parsed[text] = _parse_value(text)
+            sample[name] = value
+            continue
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        timestamp = parse_date(line, utcoffset)
+        if timestamp is None:
+            continue
+        if sample is not None:
+            _add_sample(columns, len(times) - 1, sample)
+        if (start is not None and timestamp < start) or (end is not None and timestamp >= end):
+            sample = None
+            continue
+        times.append(timestamp)
+        sample = {}
+    if sample is not None:
+        _add_sample(columns, len(times) - 1, sample)
+
+    result = {'time': np.array(times, dtype = np.float64)}
+    for name in (names if names is not None else columns):
+        column = np.full(len(times), np.nan)
+        if name in columns:
+            indices, values = columns[name]
+            column[indices] = values
+        result[name] = column
+    return result
+
+def _add_sample(columns, index, sample):
+    for name, value in sample.items():
+        if name not in columns:
+            columns[name] = ([], [])
+        indices, values = columns[name]
+        indices.append(index)
+        values.append(value)
+
+
+def load(path, names = None, start = None, end = None, utcoffset = None):
+    ''' Loads samples from a text log or a binary store, whatever path is
+
+    :returns: A dict of name to float64 array, plus 'time'
+    '''
+    with open(path, 'rb') as f:
+        binary = f.read(len(MAGIC)) == MAGIC
+    if binary:
+        return StoreReader(path).columns(names, start, end)
+    with open(path, 'r', encoding = 'utf-8', errors = 'replace') as f:
+        return load_log(f, names, start, end, utcoffset)
+
+__all__ = [
+    "load",
+    "load_log",
+    "parse_date",
+]
@@ -0,0 +1,161 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Transaction metrics: latency, failures and bytes on the wire of every
+# Modbus transaction of one or more clients, to see how much of a bus the
+# controllers on it use.
+
+import threading
+import time
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets in seconds, the last one is open
+DEFAULT_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+
+# outcomes of a transaction
+OK = 'ok'
+EXCEPTION = 'exception'
+TIMEOUT = 'timeout'
+
+
+def outcome(response):
+    ''' Classifies a response as OK, EXCEPTION (answered with an exception
+    code) or TIMEOUT (no usable answer at all)
+    '''
+    if response is None or not hasattr(response, "isError"):
+        return TIMEOUT
+    if not response.isError():
+        return OK
+    if hasattr(response, "exception_code"):
+        return EXCEPTION
+    return TIMEOUT
+
+
+def frame_sizes(function, count, result):
+    ''' Returns the RTU frame sizes (request, response) of a transaction
+
+    :param function: The function code
+    :param count: The number of bits or registers read or written
+    :param result: The outcome of the transaction
+    '''
+    if function in (15, 16):
+        request = 9 + (2 * count if function == 16 else (count + 7) // 8)
+    else:
+        request = 8
+    if result == TIMEOUT:
+        return request, 0
+    if result == EXCEPTION:
+        return request, 5
+    if function in (1, 2):
+        return request, 5 + (count + 7) // 8
+    if function in (3, 4):
+        return request, 5 + 2 * count
+    return request, 8
+
+
+class TransactionStats:
+    ''' Counters of the transactions of one unit with one function code
+    '''
+
+    def __init__(self, buckets):
+        self.count = 0
+        self.exceptions = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        # one more bucket for everything above the last bound
+        self.histogram = [0] * (len(buckets) + 1)
+
+    @property
+    def mean_time(self):
+        return self.time / self.count if self.count else 0.0
+
+
+class TransactionMetrics:
+    ''' Collects TransactionStats per (unit, function code)
+
+    One instance can be shared by all clients on a bus, e.g. through
+    BusScheduler(metrics = ...), to get the utilization of the whole bus.
+    '''
+
+    def __init__(self, buckets = DEFAULT_BUCKETS, clock = time.monotonic):
+        self.buckets = tuple(buckets)
+        self.clock = clock
+        self.stats = {}
+        self.started = clock()
+        self.lock = threading.Lock()
+
+    def record(self, unit, function, count, elapsed, response, retry = False):
+        ''' Records one transaction
+
+        :param unit: The modbus unit id
+        :param function: The function code
+        :param count: The number of bits or registers read or written
+        :param elapsed: The time from sending the request to the response in seconds
+        :param response: The response, for its outcome
+        :param retry: Whether this transaction repeats a failed one
+        '''
+        result = outcome(response)
+        sent, received = frame_sizes(function, count, result)
+        bucket = 0
+        while bucket < len(self.buckets) and elapsed > self.buckets[bucket]:
+            bucket += 1
+        with self.lock:
+            stats = self.stats.get((unit, function))
+            if stats is None:
+                stats = self.stats[(unit, function)] = TransactionStats(self.buckets)
+            stats.count += 1
+            if result == EXCEPTION:
+                stats.exceptions += 1
+            elif result == TIMEOUT:
+                stats.timeouts += 1
+            if retry:
+                stats.retries += 1
+            stats.bytes_sent += sent
+            stats.bytes_received += received
+            stats.time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+            stats.histogram[bucket] += 1
+        return result
+
+    def total(self, unit = None):
+        ''' Returns the sum of all stats, or of those of one unit
+        '''
+        total = TransactionStats(self.buckets)
+        with self.lock:
+            for (u, function), stats in self.stats.items():
+                if unit is not None and u != unit:
+                    continue
+                for name in ('count', 'exceptions', 'timeouts', 'retries',
+                             'bytes_sent', 'bytes_received', 'time'):
+                    setattr(total, name, getattr(total, name) + getattr(stats, name))
+                total.max_time = max(total.max_time, stats.max_time)
+                total.histogram = [a + b for a, b in zip(total.histogram, stats.histogram)]
+        return total
+
+    def utilization(self, now = None):
+        ''' Returns the share of the time since the start (or reset) spent in transactions
+        '''
+        elapsed = (self.clock() if now is None else now) - self.started
+        if elapsed <= 0:
+            return 0.0
+        return min(1.0, self.total().time / elapsed)
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+            self.started = self.clock()
+
+__all__ = [
+    "TransactionMetrics",
+    "TransactionStats",
+    "outcome",
+    "frame_sizes",
+]
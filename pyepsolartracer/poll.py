@@ -0,0 +1,327 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Long running poller: keeps the port open, reads the registers on a fixed
+# schedule and hands the values to sinks. Run it with
+#
+#   python -m pyepsolartracer.poll --port /dev/ttyXRUSB0 --output log.txt
+
+from pyepsolartracer.client import EPsolarTracerClient, EPChargerFlag, charger_state_flags
+from pyepsolartracer import registers as registertable
+
+import argparse
+import re
+import sys
+import time
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class Sink:
+    ''' Receives the values of every poll cycle
+    '''
+
+    def write(self, timestamp, values):
+        ''' Handles the values of one cycle
+
+        :param timestamp: The time of the cycle, seconds since the epoch
+        :param values: The list of Values read
+        '''
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class TextSink(Sink):
+    ''' Writes the values in the text format of info.py
+
+    Every cycle starts with a line in the format of date(1) and ends with
+    an empty line, like the log.txt written by watch.sh.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    @classmethod
+    def open(cls, path):
+        ''' Creates a sink appending to a file, '-' is stdout
+        '''
+        if path == '-':
+            return cls(sys.stdout)
+        return cls(open(path, 'a'))
+
+    def write(self, timestamp, values):
+        lines = [time.strftime('%a %b %d %H:%M:%S %Z %Y', time.localtime(timestamp))]
+        lines.extend(str(value) for value in values)
+        self.stream.write("\n".join(lines) + "\n\n")
+        self.stream.flush()
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class CallbackSink(Sink):
+    ''' Calls a function with the values of every cycle
+    '''
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, timestamp, values):
+        self.callback(timestamp, values)
+
+
+# charger states that need a closer look
+_FAULTS = EPChargerFlag.FAULT | EPChargerFlag.SHORT_PV | EPChargerFlag.SHORT_LOAD_FET | \
+    EPChargerFlag.SHORT_LOAD | EPChargerFlag.OVERCURRENT_LOAD | EPChargerFlag.OVERCURRENT_INPUT | \
+    EPChargerFlag.SHORT_ANTIREVERSE | EPChargerFlag.SHORT_CHARGING_OR_ANTIREVERSE | \
+    EPChargerFlag.SHORT_CHARGING_FET | EPChargerFlag.INPUT_OVERVOLT | \
+    EPChargerFlag.INPUT_VOLTAGE_ERROR | EPChargerFlag.INVALID_VALUE
+
+
+class AdaptiveInterval:
+    ''' Poll interval following what the controller is doing
+
+    Idle times, night or a charger in CHARGE_STOP/STANDBY, stretch the
+    interval by growth every cycle up to max_interval. Faults, failed reads
+    and any change of the charger state or of Day/Night bring it straight
+    back to min_interval, as does charging in daylight.
+    '''
+
+    # the registers the policy looks at, read along with the poller's own
+    names = ["Day/Night", "Charging equipment status"]
+
+    def __init__(self, min_interval = 10, max_interval = 60, growth = 2.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.growth = growth
+        self.interval = min_interval
+        self._previous = None
+
+    def next_interval(self, values):
+        ''' Returns the interval to the next cycle
+
+        :param values: The Values read in this cycle, None if the cycle failed
+        '''
+        state = None
+        if values is not None:
+            byName = {value.register.name: value.value for value in values}
+            night = byName.get("Day/Night")
+            status = byName.get("Charging equipment status")
+            if night is not None and status is not None:
+                state = (bool(night), charger_state_flags(int(status) & 0xffff))
+        previous, self._previous = self._previous, state
+        if state is None or state != previous or state[1] & _FAULTS:
+            self.interval = self.min_interval
+        elif state[0] or state[1] & (EPChargerFlag.CHARGE_STOP | EPChargerFlag.STANDBY):
+            self.interval = min(self.max_interval, self.interval * self.growth)
+        else:
+            self.interval = self.min_interval
+        return self.interval
+
+
+
+class Poller:
+    ''' Reads a set of registers periodically
+
+    Cycles are scheduled on a fixed grid from the start time, so the period
+    does not drift with the time spent reading. When a cycle overruns, the
+    missed slots are skipped. A failing cycle closes the connection, it is
+    opened again at the next cycle.
+    '''
+
+    def __init__(self, client, names = None, interval = 10, sinks = (), on_connect = None,
+                 clock = time.monotonic, sleep = time.sleep, wallclock = time.time, policy = None):
+        ''' Initialize a poller
+
+        :param client: The EPsolarTracerClient to read from
+        :param names: The register names to read, all registers by default
+        :param interval: The time between two cycles in seconds
+        :param sinks: The Sinks receiving the values
+        :param on_connect: Called with the client after every successful connect
+        :param policy: An AdaptiveInterval (or anything with names and
+            next_interval(values)) setting the interval after every cycle
+        '''
+        self.client = client
+        self.names = list(names) if names is not None else [reg.name for reg in registertable.registers]
+        self.interval = interval
+        self.policy = policy
+        # registers only the policy wants, they are not handed to the sinks
+        self._extra = [name for name in getattr(policy, 'names', ()) if name not in self.names]
+        self.sinks = list(sinks)
+        self.on_connect = on_connect
+        self.clock = clock
+        self.sleep = sleep
+        self.wallclock = wallclock
+        self.connected = False
+        self.cycles = 0
+        self.failures = 0
+        self._running = False
+
+    def _connect(self):
+        if not self.connected:
+            if not self.client.connect():
+                raise IOError("Cannot connect to " + str(self.client.client))
+            self.connected = True
+            if self.on_connect is not None:
+                self.on_connect(self.client)
+
+    def _disconnect(self):
+        self.connected = False
+        try:
+            self.client.close()
+        except Exception as e:
+            _logger.debug("Close failed: " + repr(e))
+
+    def poll_once(self):
+        ''' Runs one cycle: reads all registers and hands them to the sinks
+
+        :returns: The Values read, or None if the cycle failed
+        '''
+        timestamp = self.wallclock()
+        try:
+            self._connect()
+            values = self.client.read_many(self.names + self._extra)
+            if values and all(value.value is None for value in values):
+                raise IOError("No response from the device")
+        except Exception as e:
+            self.failures += 1
+            _logger.warning("Poll failed, reconnecting: " + repr(e))
+            self._disconnect()
+            if self.policy is not None:
+                self.interval = self.policy.next_interval(None)
+            return None
+        self.cycles += 1
+        if self.policy is not None:
+            self.interval = self.policy.next_interval(values)
+        values = values[:len(self.names)]
+        for sink in self.sinks:
+            try:
+                sink.write(timestamp, values)
+            except Exception as e:
+                _logger.error("Sink " + repr(sink) + " failed: " + repr(e))
+        return values
+
+    def run(self, cycles = None):
+        ''' Polls until stop() is called or the number of cycles has been run
+        '''
+        self._running = True
+        deadline = self.clock()
+        while self._running and (cycles is None or cycles > 0):
+            self.poll_once()
+            if cycles is not None:
+                cycles -= 1
+                if cycles == 0:
+                    break
+            now = self.clock()
+            # next slot on the grid that is still ahead of us, the interval
+            # may have been changed by the policy
+            deadline += self.interval
+            if deadline <= now:
+                deadline += (int((now - deadline) / self.interval) + 1) * self.interval
+            delay = deadline - now
+            if delay > 0:
+                self.sleep(delay)
+
+    def stop(self):
+        self._running = False
+
+    def close(self):
+        self.stop()
+        self._disconnect()
+        for sink in self.sinks:
+            sink.close()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "python -m pyepsolartracer.poll",
+                                     description = "Poll an EPsolar Tracer periodically")
+    parser.add_argument('--port', default = '/dev/ttyXRUSB0', help = "serial port")
+    parser.add_argument('--baudrate', type = int, default = 115200)
+    parser.add_argument('--unit', type = int, default = 1, help = "modbus unit id")
+    parser.add_argument('--timeout', type = float, default = 1, help = "response timeout in seconds")
+    parser.add_argument('--interval', type = float, default = 10, help = "seconds between samples")
+    parser.add_argument('--max-interval', type = float,
+                        help = "poll up to this many seconds apart at night and while not charging")
+    parser.add_argument('--output', default = '-', help = "file to append to, - for stdout")
+    parser.add_argument('--store', help = "binary sample store to append to")
+    parser.add_argument('--changes-only', action = 'store_true', help = "only write values that changed")
+    parser.add_argument('--heartbeat', type = float, default = 300,
+                        help = "seconds after which unchanged values are written again, with --changes-only")
+    parser.add_argument('--exclude', help = "regular expression of register names to leave out")
+    parser.add_argument('--rtu', action = 'store_true',
+                        help = "use the built-in RTU transport, --timeout is then the longest wait for an answer")
+    parser.add_argument('--discover', action = 'store_true',
+                        help = "find the registers the device answers once and skip the others")
+    parser.add_argument('--rs485', action = 'store_true', help = "put the serial port into RS-485 mode")
+    parser.add_argument('--verbose', '-v', action = 'store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
+    if args.rtu:
+        from pyepsolartracer.rtu import RtuClient, AdaptiveTimeout
+        timeout = AdaptiveTimeout(initial = args.timeout, maximum = args.timeout)
+        serialclient = RtuClient(args.port, args.baudrate, timeout)
+    else:
+        from pymodbus.client import ModbusSerialClient as ModbusClient
+        serialclient = ModbusClient(method = 'rtu', port = args.port, baudrate = args.baudrate,
+                                    stopbits = 1, bytesize = 8, timeout = args.timeout)
+    client = EPsolarTracerClient(unit = args.unit, serialclient = serialclient)
+
+    def on_connect(client):
+        if args.rs485:
+            import serial.rs485
+            try:
+                client.client.socket.rs485_mode = serial.rs485.RS485Settings()
+            except (ValueError, OSError) as e:
+                # not every port supports the RS-485 ioctl, poll without it;
+                # pyserial keeps the setting and would fail again on every reconfiguration
+                _logger.warning("Cannot set RS-485 mode: " + str(e))
+                client.client.socket.rs485_mode = None
+        if args.discover and client.capabilities is None:
+            from pyepsolartracer.discovery import load_capabilities
+            client.capabilities = load_capabilities(client)
+
+    names = [reg.name for reg in registertable.registers]
+    if args.exclude:
+        exclude = re.compile(args.exclude)
+        names = [name for name in names if not exclude.search(name)]
+
+    sinks = [TextSink.open(args.output)]
+    if args.changes_only:
+        # the change filter builds on the sinks of this module
+        from pyepsolartracer.changes import ChangeSink, ChangeFilter
+        sinks = [ChangeSink(sinks, ChangeFilter(heartbeat = args.heartbeat))]
+    if args.store:
+        # the store builds on the sinks of this module
+        from pyepsolartracer.store import StoreSink
+        sinks.append(StoreSink(args.store, names))
+
+    policy = None
+    if args.max_interval:
+        policy = AdaptiveInterval(args.interval, args.max_interval)
+    poller = Poller(client, names, args.interval, sinks, on_connect = on_connect, policy = policy)
+    try:
+        poller.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        poller.close()
+
+__all__ = [
+    "Poller",
+    "AdaptiveInterval",
+    "Sink",
+    "TextSink",
+    "CallbackSink",
+]
+
+if __name__ == '__main__':
+    main()
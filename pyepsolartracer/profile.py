@@ -0,0 +1,193 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Settings profiles: the desired values of the holding registers (and coils)
+# of a controller, kept in a JSON file of register name to scaled value.
+# Applying a profile reads the current settings in bulk, writes only what
+# differs and reads the written registers back. Run it with
+#
+#   python -m pyepsolartracer.profile --port /dev/ttyXRUSB0 save settings.json
+#   python -m pyepsolartracer.profile --port /dev/ttyXRUSB0 --unit 1 2 3 apply settings.json
+
+from pyepsolartracer.client import EPsolarTracerClient, CLOCK
+from pyepsolartracer.registers import registerByName
+from pyepsolartracer import registers as registertable
+
+import json
+import sys
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+
+def settings_names():
+    ''' Returns the names of all settings, the holding registers except the clock
+    '''
+    return [reg.name for reg in registertable.registers
+            if reg.is_holding_register() and reg.name not in CLOCK]
+
+
+class ApplyResult:
+    ''' What applying a profile to one controller did
+    '''
+
+    def __init__(self):
+        # name: (value before, value of the profile)
+        self.changed = {}
+        # names that could not be written, or read back with another value
+        self.failed = []
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def __str__(self):
+        return str({ 'changed': len(self.changed), 'failed': self.failed})
+
+
+class Profile:
+    ''' Desired values of writable registers, by register name
+    '''
+
+    def __init__(self, values):
+        ''' Initialize a profile
+
+        :param values: A dict of register name to scaled value
+        :raises ValueError: For registers that cannot be written, or values
+            out of their range
+        '''
+        self.values = dict(values)
+        for name, value in self.values.items():
+            reg = registerByName(name)
+            if reg.is_input_register() or reg.is_discrete_input():
+                raise ValueError("Cannot write " + reg.kind + " " + repr(name))
+            reg.encode_words(value)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding = 'utf-8') as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        with open(path, 'w', encoding = 'utf-8') as f:
+            json.dump(self.values, f, indent = 2, ensure_ascii = False)
+            f.write("\n")
+
+    @classmethod
+    def read(cls, client, names = None):
+        ''' Creates a profile from the current settings of a controller
+
+        Registers that cannot be read (e.g. settings the model does not
+        have) are left out of the profile.
+
+        :param names: The registers to take, all settings by default
+        :raises IOError: If no register could be read at all
+        '''
+        if names is None:
+            names = settings_names()
+        values = client.read_many(names)
+        missing = [value.register.name for value in values if value.value is None]
+        if len(missing) == len(values):
+            raise IOError("Cannot read any setting of unit " + str(client.unit))
+        if missing:
+            _logger.warning("Leaving out settings that cannot be read: " + ", ".join(missing))
+        return cls((value.register.name, value.value) for value in values if value.value is not None)
+
+    def diff(self, current):
+        ''' Returns the values of the profile that differ from the current ones
+
+        Values are compared as raw register words, so 13.8 and 13.80000001
+        are the same setting.
+
+        :param current: The Values read from the controller
+        :returns: A dict of register name to the value of the profile
+        '''
+        have = {value.register.name: value.value for value in current}
+        changes = {}
+        for name, value in self.values.items():
+            reg = registerByName(name)
+            old = have.get(name)
+            if old is None or reg.encode_words(old) != reg.encode_words(value):
+                changes[name] = value
+        return changes
+
+    def apply(self, client, verify = True, dry_run = False):
+        ''' Writes the settings that differ from the profile
+
+        :param client: The EPsolarTracerClient of the controller
+        :param verify: Read the written registers back and compare them
+        :param dry_run: Only work out what would change
+        :returns: An ApplyResult
+        '''
+        result = ApplyResult()
+        names = list(self.values)
+        current = client.read_many(names)
+        before = {value.register.name: value.value for value in current}
+        changes = self.diff(current)
+        result.changed = {name: (before[name], value) for name, value in changes.items()}
+        if dry_run or not changes:
+            return result
+        written = client.write_many(changes)
+        if not written:
+            _logger.warning("Writing the profile failed on unit " + str(client.unit))
+        if verify:
+            # a failed write may still have set some of the blocks
+            result.failed = list(self.__class__(changes).diff(client.read_many(list(changes))))
+        elif not written:
+            result.failed = list(changes)
+        return result
+
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "python -m pyepsolartracer.profile",
+                                     description = "Save or apply EPsolar Tracer settings")
+    parser.add_argument('--port', default = '/dev/ttyXRUSB0', help = "serial port")
+    parser.add_argument('--baudrate', type = int, default = 115200)
+    parser.add_argument('--unit', type = int, nargs = '+', default = [1], help = "modbus unit ids")
+    parser.add_argument('--timeout', type = float, default = 1, help = "response timeout in seconds")
+    parser.add_argument('--dry-run', action = 'store_true', help = "only show what would change")
+    parser.add_argument('action', choices = ['save', 'apply'])
+    parser.add_argument('path', help = "JSON file of register name to value")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig()
+
+    from pymodbus.client import ModbusSerialClient as ModbusClient
+    serialclient = ModbusClient(method = 'rtu', port = args.port, baudrate = args.baudrate,
+                                stopbits = 1, bytesize = 8, timeout = args.timeout)
+    serialclient.connect()
+    failed = False
+    try:
+        if args.action == 'save':
+            client = EPsolarTracerClient(unit = args.unit[0], serialclient = serialclient)
+            try:
+                Profile.read(client).save(args.path)
+            except IOError as e:
+                print(str(e))
+                return 1
+            return 0
+        profile = Profile.load(args.path)
+        # the units share the port, one after the other
+        for unit in args.unit:
+            client = EPsolarTracerClient(unit = unit, serialclient = serialclient)
+            result = profile.apply(client, dry_run = args.dry_run)
+            for name, (old, new) in result.changed.items():
+                print("unit %d: %s %s -> %s" % (unit, name, old, new))
+            if not result.ok:
+                failed = True
+                print("unit %d: failed %s" % (unit, ", ".join(result.failed)))
+    finally:
+        serialclient.close()
+    return 1 if failed else 0
+
+__all__ = [
+    "Profile",
+    "ApplyResult",
+    "settings_names",
+]
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,384 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Lean Modbus RTU transport for the Tracer clients. The length of every
+# response is known from its request, so a transaction ends as soon as the
+# last byte is in instead of waiting for a timeout, and the wait for the
+# first byte adapts to the turnaround of the device. Use it in place of
+# pymodbus' ModbusSerialClient:
+#
+#   client = EPsolarTracerClient(serialclient = RtuClient('/dev/ttyXRUSB0'))
+
+from pyepsolartracer.bus import interframe_gap
+
+import struct
+import time
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+# bits per character of a Modbus RTU frame: start, 8 data, parity or stop, stop
+BITS_PER_BYTE = 11
+
+
+class AdaptiveTimeout:
+    ''' First byte timeout learned from the turnaround of the device
+
+    Until the first answer the initial timeout is used. After that the
+    timeout is factor times the largest recent turnaround, where "recent"
+    fades by decay per answer, kept between minimum and maximum. Every
+    timeout doubles it, up to maximum.
+    '''
+
+    def __init__(self, initial = 1.0, minimum = 0.02, maximum = 1.0, factor = 3.0, decay = 0.98):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.decay = decay
+        self.turnaround = None
+
+    @property
+    def timeout(self):
+        if self.turnaround is None:
+            return self.initial
+        return min(self.maximum, max(self.minimum, self.factor * self.turnaround))
+
+    def observe(self, turnaround):
+        ''' Takes the time from the end of a request to the first byte of its response
+        '''
+        if self.turnaround is None:
+            self.turnaround = turnaround
+        else:
+            self.turnaround = max(turnaround, self.turnaround * self.decay)
+
+    def timed_out(self):
+        ''' Backs off after a request was not answered in time
+        '''
+        if self.turnaround is not None:
+            self.turnaround = min(self.maximum, 2 * self.timeout) / self.factor
+
+
+#---------------------------------------------------------------------------#
+# Responses, with the attributes of the pymodbus responses the clients use
+#---------------------------------------------------------------------------#
+class Response:
+
+    def isError(self):
+        return False
+
+
+class RegistersResponse(Response):
+    ''' Read registers, kept as the raw data bytes of the response frame
+
+    ReadBlock.decode works on the payload directly, the list of registers
+    is only unpacked for callers asking for it.
+    '''
+
+    def __init__(self, payload):
+        self.payload = payload
+        self._registers = None
+
+    @property
+    def registers(self):
+        if self._registers is None:
+            self._registers = list(struct.unpack('>%dH' % (len(self.payload) // 2), self.payload))
+        return self._registers
+
+    def getRegister(self, index):
+        return self.registers[index]
+
+    def __repr__(self):
+        return "RegistersResponse(%d)" % (len(self.payload) // 2)
+
+
+class BitsResponse(Response):
+
+    def __init__(self, bits):
+        self.bits = bits
+
+    def __repr__(self):
+        return "BitsResponse(%d)" % len(self.bits)
+
+
+class WriteResponse(Response):
+
+    def __init__(self, address, value):
+        self.address = address
+        self.value = value
+
+    def __repr__(self):
+        return "WriteResponse(%d, %d)" % (self.address, self.value)
+
+
+class ExceptionResponse(Response):
+
+    def __init__(self, function_code, exception_code):
+        self.function_code = function_code
+        self.exception_code = exception_code
+
+    def isError(self):
+        return True
+
+    def __repr__(self):
+        return "ExceptionResponse(%d, %d)" % (self.function_code, self.exception_code)
+
+
+class NoResponse(Response):
+    ''' No usable answer: nothing came, or a broken frame
+    '''
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def isError(self):
+        return True
+
+    def __repr__(self):
+        return "NoResponse(%r)" % self.reason
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for i in range(8):
+            crc = (crc >> 1) ^ 0xa001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+_CRC_TABLE = _crc_table()
+
+def crc16(data):
+    ''' Returns the Modbus CRC of data, one table lookup per byte
+
+    Over a whole frame, CRC included, the result is 0.
+    '''
+    crc = 0xffff
+    table = _CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xff]
+    return crc
+
+def crc_bytes(data):
+    ''' Returns the two CRC bytes to append to data, low byte first
+    '''
+    return crc16(data).to_bytes(2, 'little')
+
+# number of encoded read requests kept per client, a poll plan needs a few dozen
+MAX_FRAMES = 256
+
+
+class RtuClient:
+    ''' Modbus RTU master for the requests of EPsolarTracerClient
+
+    Offers the read/write methods of pymodbus' ModbusSerialClient that the
+    clients call, plus execute() for other pymodbus requests (device
+    information), whose responses are decoded by pymodbus.
+    '''
+
+    def __init__(self, port = '/dev/ttyXRUSB0', baudrate = 115200, timeout = None, slack = 0.02,
+                 serial = None, gap = None):
+        ''' Initialize an RTU client
+
+        :param port: The serial port
+        :param baudrate: The baud rate, for the byte time and t3.5
+        :param timeout: An AdaptiveTimeout for the first byte of responses
+        :param slack: Extra seconds allowed for the rest of a response, for
+            USB adapters passing bytes on in chunks
+        :param serial: An open pyserial compatible port to use instead of port
+        :param gap: Silence before every request, t3.5 of the baud rate by default
+        '''
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout if timeout is not None else AdaptiveTimeout()
+        self.slack = slack
+        self.socket = serial
+        self.byte_time = BITS_PER_BYTE / baudrate
+        self.gap = interframe_gap(baudrate) if gap is None else gap
+        self._last = 0.0
+        self._frames = {}
+
+    def connect(self):
+        ''' Opens the port
+        :returns: True if the port is open, False otherwise
+        '''
+        if self.socket is None:
+            import serial
+            try:
+                self.socket = serial.Serial(self.port, self.baudrate, bytesize = 8, parity = 'N', stopbits = 1)
+            except serial.SerialException as e:
+                _logger.error("Cannot open " + repr(self.port) + ": " + str(e))
+                return False
+        return True
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def __str__(self):
+        return "rtu baud[%s]" % self.baudrate
+
+    def _read(self, size, timeout):
+        self.socket.timeout = timeout
+        return self.socket.read(size)
+
+    def transaction(self, request, expected = None):
+        ''' Sends a request frame and receives the response frame
+
+        :param request: The request without CRC
+        :param expected: The length of a normal response including CRC, None
+            if unknown, then the response ends with t3.5 of silence
+        :returns: A memoryview of the response without CRC, or a NoResponse
+        '''
+        return self._transfer(request + crc_bytes(request), expected)
+
+    def _transfer(self, frame, expected):
+        if self.socket is None and not self.connect():
+            return NoResponse("not connected")
+        silence = self._last + self.gap - time.perf_counter()
+        if silence > 0:
+            time.sleep(silence)
+        self.socket.reset_input_buffer()
+        self.socket.write(frame)
+        self.socket.flush()
+        # the request is on the line at the latest after its byte time
+        sent = time.perf_counter()
+        first = self._read(1, self.timeout.timeout + len(frame) * self.byte_time)
+        if not first:
+            self.timeout.timed_out()
+            # a late answer must not be taken for the answer to the next request
+            self._drain(self.timeout.timeout)
+            return NoResponse("timeout")
+        self.timeout.observe(max(0.0, time.perf_counter() - sent - len(frame) * self.byte_time))
+        data = first + self._read(1, 2 * self.byte_time + self.slack)
+        if len(data) == 2 and data[1] & 0x80:
+            # exception response, always 5 bytes
+            expected = 5
+        if expected is not None:
+            rest = expected - len(data)
+            data += self._read(rest, rest * self.byte_time * 1.5 + self.slack)
+        else:
+            while True:
+                more = self._read(256, self.gap + self.slack)
+                if not more:
+                    break
+                data += more
+        self._last = time.perf_counter()
+        if len(data) < 4 or (expected is not None and len(data) != expected):
+            self._drain(0.0)
+            return NoResponse("incomplete frame " + repr(data))
+        if crc16(data):
+            return NoResponse("crc error " + repr(data))
+        if data[0] != frame[0] or (data[1] & 0x7f) != frame[1]:
+            return NoResponse("unexpected frame " + repr(data))
+        # views share the frame, slicing the data out of it copies nothing
+        return memoryview(data)[:-2]
+
+    def _drain(self, wait):
+        ''' Throws away whatever comes in until the line is quiet
+
+        Waits up to wait seconds for a late answer to start, then reads until
+        t3.5 plus slack of silence, for at most the maximum timeout.
+        '''
+        quiet = max(wait, self.gap + self.slack)
+        deadline = time.perf_counter() + self.timeout.maximum
+        while True:
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                break
+            late = self._read(256, min(quiet, left))
+            if not late:
+                break
+            _logger.info("Dropped late bytes " + repr(late))
+            quiet = self.gap + self.slack
+        self._last = time.perf_counter()
+
+    def _exchange(self, frame, expected):
+        ''' Transfers a frame including CRC, the response is checked for exceptions
+        '''
+        response = self._transfer(frame, expected)
+        if isinstance(response, NoResponse):
+            _logger.info("No response to " + repr(frame) + ": " + response.reason)
+            return response
+        if response[1] & 0x80:
+            return ExceptionResponse(response[1] & 0x7f, response[2])
+        return response
+
+    def _read_frame(self, slave, function, address, count):
+        ''' Returns the encoded read request, built once per distinct read
+        '''
+        key = (slave, function, address, count)
+        frame = self._frames.get(key)
+        if frame is None:
+            if len(self._frames) >= MAX_FRAMES:
+                self._frames.clear()
+            request = struct.pack('>BBHH', slave, function, address, count)
+            frame = self._frames[key] = request + crc_bytes(request)
+        return frame
+
+    def _read_bits(self, function, address, count, slave):
+        response = self._exchange(self._read_frame(slave, function, address, count),
+                                  5 + (count + 7) // 8)
+        if isinstance(response, Response):
+            return response
+        bits = []
+        for byte in response[3:]:
+            bits.extend(bool(byte >> i & 1) for i in range(8))
+        return BitsResponse(bits)
+
+    def _read_words(self, function, address, count, slave):
+        response = self._exchange(self._read_frame(slave, function, address, count),
+                                  5 + 2 * count)
+        if isinstance(response, Response):
+            return response
+        return RegistersResponse(response[3:3 + 2 * count])
+
+    def read_coils(self, address, count = 1, slave = 0, **kwargs):
+        return self._read_bits(1, address, count, slave)
+
+    def read_discrete_inputs(self, address, count = 1, slave = 0, **kwargs):
+        return self._read_bits(2, address, count, slave)
+
+    def read_holding_registers(self, address, count = 1, slave = 0, **kwargs):
+        return self._read_words(3, address, count, slave)
+
+    def read_input_registers(self, address, count = 1, slave = 0, **kwargs):
+        return self._read_words(4, address, count, slave)
+
+    def write_coil(self, address, value, slave = 0, **kwargs):
+        request = struct.pack('>BBHH', slave, 5, address, 0xff00 if value else 0)
+        response = self._exchange(request + crc_bytes(request), 8)
+        if isinstance(response, Response):
+            return response
+        return WriteResponse(*struct.unpack('>HH', response[2:6]))
+
+    def write_registers(self, address, values, slave = 0, **kwargs):
+        if isinstance(values, int):
+            values = [values]
+        request = struct.pack('>BBHHB%dH' % len(values), slave, 16, address, len(values),
+                              2 * len(values), *values)
+        response = self._exchange(request + crc_bytes(request), 8)
+        if isinstance(response, Response):
+            return response
+        return WriteResponse(*struct.unpack('>HH', response[2:6]))
+
+    def execute(self, request):
+        ''' Runs any pymodbus request, decoding the response with pymodbus
+        '''
+        from pymodbus.factory import ClientDecoder
+        pdu = bytes([request.slave_id, request.function_code]) + request.encode()
+        response = self._exchange(pdu + crc_bytes(pdu), None)
+        if isinstance(response, Response):
+            return response
+        return ClientDecoder().decode(bytes(response[1:]))
+
+__all__ = [
+    "RtuClient",
+    "AdaptiveTimeout",
+    "crc16",
+    "crc_bytes",
+]
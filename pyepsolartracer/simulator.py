@@ -0,0 +1,397 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Simulated Tracer: a register image answering Modbus RTU requests on a
+# pseudo terminal, with the timing of a serial line. Any client can open the
+# pty like a real port. Run it with
+#
+#   python -m pyepsolartracer.simulator
+
+from pyepsolartracer.registers import registerByName, COIL, DISCRETE_INPUT, INPUT_REGISTER, HOLDING_REGISTER
+from pyepsolartracer import registers as registertable
+from pyepsolartracer.rtu import crc16, crc_bytes
+
+import math
+import os
+import select
+import struct
+import threading
+import time
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 1
+ILLEGAL_ADDRESS = 2
+ILLEGAL_VALUE = 3
+
+# read function code to the data space it reads
+_READ_SPACES = {1: COIL, 2: DISCRETE_INPUT, 3: HOLDING_REGISTER, 4: INPUT_REGISTER}
+
+# values of a Tracer on a sunny afternoon, everything else is 0
+DEFAULT_VALUES = {
+    "Charging equipment rated input voltage": 150.0,
+    "Charging equipment rated input current": 20.0,
+    "Charging equipment rated input power": 520.0,
+    "Charging equipment rated output voltage": 24.0,
+    "Charging equipment rated output current": 20.0,
+    "Charging equipment rated output power": 520.0,
+    "Charging mode": 1,
+    "Rated output current of load": 20.0,
+    "Charging equipment input voltage": 48.3,
+    "Charging equipment input current": 1.25,
+    "Charging equipment input power": 60.37,
+    "Charging equipment output voltage": 27.1,
+    "Charging equipment output current": 2.15,
+    "Charging equipment output power": 58.26,
+    "Discharging equipment output voltage": 26.9,
+    "Discharging equipment output current": 0.3,
+    "Discharging equipment output power": 8.07,
+    "Battery Temperature": 25.0,
+    "Temperature inside equipment": 25.1,
+    "Power components temperature": 26.3,
+    "Battery SOC": 87,
+    "Battery's real rated power": 24.0,
+    "Charging equipment status": 0x0009,
+    "Battery Current": 1.85,
+    "Battery Type": 1,
+    "Battery Capacity": 200,
+    "Boost voltage": 14.4,
+    "Float voltage": 13.8,
+    "Low voltage disconnect": 11.1,
+    "Manual control the load": 1,
+}
+
+
+class RegisterImage:
+    ''' The contents of the four Modbus data spaces of a device
+
+    Every space is a dict of address to value (a 16 bit word, or 0/1 for
+    coils and discrete inputs). Addresses missing from a space are answered
+    with an illegal address exception.
+    '''
+
+    def __init__(self):
+        self.spaces = {COIL: {}, DISCRETE_INPUT: {}, INPUT_REGISTER: {}, HOLDING_REGISTER: {}}
+        self.lock = threading.RLock()
+
+    @classmethod
+    def tracer(cls, values = DEFAULT_VALUES, fill_gaps = 8):
+        ''' Creates an image with all registers of the table
+
+        :param values: Initial values by register name, scaled
+        :param fill_gaps: Holes of up to this many addresses between two
+            registers are answered with 0 instead of an exception, like the
+            dense ranges of the device
+        '''
+        image = cls()
+        for reg in registertable.registers + registertable.coils:
+            for address in range(reg.address, reg.address + reg.size):
+                image.spaces[reg.kind].setdefault(address, 0)
+        if fill_gaps:
+            for space in image.spaces.values():
+                addresses = sorted(space)
+                for previous, address in zip(addresses, addresses[1:]):
+                    if 1 < address - previous <= fill_gaps + 1:
+                        for hole in range(previous + 1, address):
+                            space[hole] = 0
+        for name, value in values.items():
+            image.set(name, value)
+        return image
+
+    def set(self, name, value):
+        ''' Sets a register to a scaled value
+        '''
+        reg = registerByName(name)
+        with self.lock:
+            for i, word in enumerate(reg.encode_words(value)):
+                self.spaces[reg.kind][reg.address + i] = word
+
+    def get(self, name):
+        ''' Returns the scaled value of a register
+        '''
+        reg = registerByName(name)
+        with self.lock:
+            words = [self.spaces[reg.kind][reg.address + i] for i in range(reg.size)]
+        if reg.kind in (COIL, DISCRETE_INPUT):
+            return words[0]
+        return reg.decode_words(words).value
+
+    def read(self, space, address, count):
+        ''' Returns count values, or None if an address is not supported
+        '''
+        space = self.spaces[space]
+        with self.lock:
+            try:
+                return [space[address + i] for i in range(count)]
+            except KeyError:
+                return None
+
+    def write(self, space, address, values):
+        ''' Writes values, returns False if an address is not supported
+        '''
+        space = self.spaces[space]
+        with self.lock:
+            if any(address + i not in space for i in range(len(values))):
+                return False
+            for i, value in enumerate(values):
+                space[address + i] = value
+        return True
+
+
+def daylight(period = 86400.0):
+    ''' Returns an evolve function running a day of PV input every period seconds
+    '''
+    def evolve(image, elapsed):
+        sun = max(0.0, math.sin(2 * math.pi * elapsed / period))
+        image.set("Charging equipment input voltage", round(18.0 + 30.0 * sun, 2) if sun else 0.0)
+        image.set("Charging equipment input current", round(10.0 * sun, 2))
+        image.set("Charging equipment input power", round(480.0 * sun, 2))
+        image.set("Day/Night", 0 if sun else 1)
+    return evolve
+
+
+class TracerSimulator:
+    ''' Answers Modbus RTU requests from a RegisterImage on a pseudo terminal
+    '''
+
+    def __init__(self, image = None, unit = 1, baudrate = 115200, turnaround = 0.002,
+                 byte_time = None, evolve = None, silent = (),
+                 device_info = (b'EPsolar Tech co., Ltd', b'Tracer2215BN', b'V02.05+V07.12')):
+        ''' Initialize a simulator
+
+        :param image: The RegisterImage, a Tracer with default values if None
+        :param unit: The modbus unit id to answer to
+        :param baudrate: Used for the default byte time
+        :param turnaround: Seconds between the end of a request and the response
+        :param byte_time: Seconds per byte on the line, 11 bits at baudrate by default
+        :param evolve: Called as evolve(image, elapsed) before every request
+        :param silent: Addresses never answered, like registers some firmware times out on
+        :param device_info: Vendor, product code and revision for function 0x2B
+        '''
+        self.image = image if image is not None else RegisterImage.tracer()
+        self.unit = unit
+        self.turnaround = turnaround
+        self.byte_time = 11.0 / baudrate if byte_time is None else byte_time
+        self.evolve = evolve
+        self.silent = set(silent)
+        self.device_info = device_info
+        self.requests = 0
+        self.port = None
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._running = False
+        self._start = time.monotonic()
+
+    #-----------------------------------------------------------------------#
+    # Protocol
+    #-----------------------------------------------------------------------#
+    def handle(self, frame):
+        ''' Answers one request frame
+
+        :param frame: The complete request, including the CRC
+        :returns: The response frame, or None if there is nothing to answer
+        '''
+        if len(frame) < 4 or crc16(frame):
+            _logger.debug("Dropping bad frame " + repr(frame))
+            return None
+        unit, function = frame[0], frame[1]
+        if unit != self.unit:
+            return None
+        self.requests += 1
+        if function in _READ_SPACES and self.silent:
+            address, count = struct.unpack('>HH', frame[2:6])
+            if any(address + i in self.silent for i in range(count)):
+                return None
+        if self.evolve is not None:
+            self.evolve(self.image, time.monotonic() - self._start)
+        pdu = self._respond(function, frame[2:-2])
+        return _frame(bytes([unit]) + pdu)
+
+    def _respond(self, function, data):
+        if function in _READ_SPACES:
+            address, count = struct.unpack('>HH', data[0:4])
+            limit = 2000 if function in (1, 2) else 125
+            if not 1 <= count <= limit:
+                return _exception(function, ILLEGAL_VALUE)
+            values = self.image.read(_READ_SPACES[function], address, count)
+            if values is None:
+                return _exception(function, ILLEGAL_ADDRESS)
+            if function in (1, 2):
+                bits = 0
+                for i, bit in enumerate(values):
+                    bits |= (bit & 1) << i
+                payload = bits.to_bytes((count + 7) // 8, 'little')
+            else:
+                payload = struct.pack('>%dH' % count, *values)
+            return bytes([function, len(payload)]) + payload
+        if function == 5:
+            address, value = struct.unpack('>HH', data[0:4])
+            if value not in (0x0000, 0xff00):
+                return _exception(function, ILLEGAL_VALUE)
+            if not self.image.write(COIL, address, [1 if value else 0]):
+                return _exception(function, ILLEGAL_ADDRESS)
+            return bytes([function]) + data[0:4]
+        if function == 6:
+            address, value = struct.unpack('>HH', data[0:4])
+            if not self.image.write(HOLDING_REGISTER, address, [value]):
+                return _exception(function, ILLEGAL_ADDRESS)
+            return bytes([function]) + data[0:4]
+        if function == 15:
+            address, count, length = struct.unpack('>HHB', data[0:5])
+            bits = int.from_bytes(data[5:5 + length], 'little')
+            if not self.image.write(COIL, address, [(bits >> i) & 1 for i in range(count)]):
+                return _exception(function, ILLEGAL_ADDRESS)
+            return bytes([function]) + data[0:4]
+        if function == 16:
+            address, count, length = struct.unpack('>HHB', data[0:5])
+            if length != 2 * count:
+                return _exception(function, ILLEGAL_VALUE)
+            values = list(struct.unpack('>%dH' % count, data[5:5 + length]))
+            if not self.image.write(HOLDING_REGISTER, address, values):
+                return _exception(function, ILLEGAL_ADDRESS)
+            return bytes([function]) + data[0:4]
+        if function == 0x2b and data[0:1] == b'\x0e':
+            payload = b''
+            for i, text in enumerate(self.device_info):
+                payload += bytes([i, len(text)]) + text
+            # basic identification, conformity level 1, no more objects follow
+            return bytes([function, 0x0e, data[1], 0x01, 0x00, 0x00, len(self.device_info)]) + payload
+        return _exception(function, ILLEGAL_FUNCTION)
+
+    #-----------------------------------------------------------------------#
+    # Pseudo terminal
+    #-----------------------------------------------------------------------#
+    def open(self):
+        ''' Creates the pseudo terminal and starts answering requests
+
+        :returns: The path of the port to hand to a client
+        '''
+        import pty
+        import tty
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        tty.setraw(self._master)
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target = self._serve, name = "TracerSimulator", daemon = True)
+        self._thread.start()
+        return self.port
+
+    def close(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _serve(self):
+        buffer = b''
+        last = time.monotonic()
+        while self._running:
+            readable, _, _ = select.select([self._master], [], [], 0.05)
+            now = time.monotonic()
+            if not readable:
+                # silence ends a frame, anything left over is garbage
+                if buffer and now - last > 0.1:
+                    _logger.debug("Dropping incomplete frame " + repr(buffer))
+                    buffer = b''
+                continue
+            try:
+                buffer += os.read(self._master, 256)
+            except OSError:
+                break
+            last = now
+            while True:
+                length = _request_length(buffer)
+                if length is None or len(buffer) < length:
+                    break
+                frame, buffer = buffer[:length], buffer[length:]
+                response = self.handle(frame)
+                if response is None:
+                    if crc16(frame):
+                        # out of sync, try again one byte later
+                        buffer = frame[1:] + buffer
+                    continue
+                self._send(len(frame), response)
+
+    def _send(self, request_length, response):
+        # the request took this long to arrive on a real line
+        time.sleep(self.turnaround + request_length * self.byte_time)
+        start = time.monotonic()
+        for i in range(len(response)):
+            ahead = start + i * self.byte_time - time.monotonic()
+            if ahead > 0.0005:
+                time.sleep(ahead)
+            os.write(self._master, response[i:i + 1])
+
+
+def _request_length(buffer):
+    ''' Returns the length of the request starting the buffer, None if unknown yet
+    '''
+    if len(buffer) < 2:
+        return None
+    function = buffer[1]
+    if function in (1, 2, 3, 4, 5, 6):
+        return 8
+    if function in (15, 16):
+        if len(buffer) < 7:
+            return None
+        return 9 + buffer[6]
+    if function == 0x2b:
+        return 7
+    # unknown function, let the crc check drop the first byte
+    return 4
+
+def _exception(function, code):
+    return bytes([function | 0x80, code])
+
+def _frame(data):
+    return data + crc_bytes(data)
+
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "python -m pyepsolartracer.simulator",
+                                     description = "Simulate a Tracer on a pseudo terminal")
+    parser.add_argument('--unit', type = int, default = 1, help = "modbus unit id")
+    parser.add_argument('--baudrate', type = int, default = 115200, help = "baud rate to simulate")
+    parser.add_argument('--turnaround', type = float, default = 0.002, help = "response delay in seconds")
+    parser.add_argument('--day', type = float, help = "length of a simulated day in seconds")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig()
+    evolve = daylight(args.day) if args.day else None
+    simulator = TracerSimulator(unit = args.unit, baudrate = args.baudrate,
+                                turnaround = args.turnaround, evolve = evolve)
+    print(simulator.open(), flush = True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.close()
+
+__all__ = [
+    "RegisterImage",
+    "TracerSimulator",
+    "daylight",
+]
+
+if __name__ == '__main__':
+    main()
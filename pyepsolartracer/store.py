@@ -0,0 +1,228 @@
+# -*- coding: iso-8859-15 -*-
+#
+# Append-only binary store of samples. The file starts with a small header
+# describing the layout, followed by fixed size records:
+#
+#   float64 timestamp, uint16 word per stored address, validity bits per register
+#
+# all little endian. The timestamp alone is 8 bytes a sample, about 250 MB a
+# year at one sample a second; for tens of MB a year poll every 10 seconds
+# or less often and store only the registers needed. Writing needs only the standard library, reading uses
+# NumPy to map the records into memory.
+
+from pyepsolartracer.registers import registerByName
+from pyepsolartracer.poll import Sink
+
+import json
+import os
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#---------------------------------------------------------------------------#
+# Logging
+#---------------------------------------------------------------------------#
+import logging
+_logger = logging.getLogger(__name__)
+
+MAGIC = b'EPTS'
+VERSION = 1
+# magic, version, length of the layout that follows
+_header = struct.Struct('<4sHI')
+
+
+class Layout:
+    ''' The registers of a store and the words they are kept in
+
+    Words shared by several registers (L/H halves of 32 bit values) are
+    stored once.
+    '''
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.registers = [registerByName(name) for name in self.names]
+        addresses = set()
+        for reg in self.registers:
+            addresses.update(range(reg.address, reg.address + reg.size))
+        self.addresses = sorted(addresses)
+        self._position = {address: i for i, address in enumerate(self.addresses)}
+        self.offsets = [self._position[reg.address] for reg in self.registers]
+        self.flag_bytes = (len(self.registers) + 7) // 8
+        self.record = struct.Struct('<d%dH%dB' % (len(self.addresses), self.flag_bytes))
+
+    def encode(self, timestamp, values):
+        ''' Packs the Values of one sample into a record
+        '''
+        words = [0] * len(self.addresses)
+        flags = [0] * self.flag_bytes
+        byName = {value.register.name: value for value in values}
+        for i, reg in enumerate(self.registers):
+            value = byName.get(reg.name)
+            if value is None or value.value is None:
+                continue
+            raw = int(round(value.value * reg.times))
+            for j in range(reg.size):
+                words[self.offsets[i] + j] = (raw >> (16 * j)) & 0xffff
+            flags[i // 8] |= 1 << (i % 8)
+        return self.record.pack(timestamp, *(words + flags))
+
+    def to_bytes(self):
+        layout = json.dumps({'registers': self.names, 'addresses': self.addresses}).encode('utf-8')
+        return _header.pack(MAGIC, VERSION, len(layout)) + layout
+
+    @classmethod
+    def read_from(cls, stream):
+        ''' Reads the header of a store
+
+        :returns: The Layout and the size of the header in bytes
+        '''
+        magic, version, length = _header.unpack(stream.read(_header.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a sample store, or an unknown version")
+        description = json.loads(stream.read(length).decode('utf-8'))
+        layout = cls(description['registers'])
+        if layout.addresses != description['addresses']:
+            raise ValueError("Layout of the store does not match the register table")
+        return layout, _header.size + length
+
+
+class StoreWriter:
+    ''' Appends samples to a store, creating it if needed
+    '''
+
+    def __init__(self, path, names):
+        ''' Open a store for appending
+
+        :param path: The file of the store
+        :param names: The register names to store, must match an existing store
+        '''
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                self.layout, header = Layout.read_from(f)
+            if self.layout.names != list(names):
+                raise ValueError("Store " + repr(path) + " has different registers")
+            # drop a record cut short by a crash
+            size = os.path.getsize(path)
+            partial = (size - header) % self.layout.record.size
+            if partial:
+                _logger.warning("Dropping incomplete record at the end of " + repr(path))
+                with open(path, 'r+b') as f:
+                    f.truncate(size - partial)
+            self.stream = open(path, 'ab')
+        else:
+            self.layout = Layout(names)
+            self.stream = open(path, 'ab')
+            self.stream.write(self.layout.to_bytes())
+
+    def append(self, timestamp, values):
+        self.stream.write(self.layout.encode(timestamp, values))
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+
+class StoreReader:
+    ''' Reads a store as columns
+
+    The records are mapped into memory, reading columns copies only the
+    words of the registers asked for.
+    '''
+
+    def __init__(self, path):
+        if np is None:
+            raise ImportError("NumPy is needed to read a sample store")
+        with open(path, 'rb') as f:
+            self.layout, header = Layout.read_from(f)
+        self.names = self.layout.names
+        dtype = np.dtype([('time', '<f8'),
+                          ('words', '<u2', (len(self.layout.addresses),)),
+                          ('flags', 'u1', (self.layout.flag_bytes,))])
+        count = (os.path.getsize(path) - header) // dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype = dtype, mode = 'r', offset = header, shape = (count,))
+        else:
+            self.records = np.zeros(0, dtype = dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def times(self):
+        return self.records['time']
+
+    def columns(self, names = None, start = None, end = None):
+        ''' Returns scaled values per register, NaN where no value was read
+
+        :param names: The registers to return, all by default; registers
+            the store does not hold are all NaN
+        :param start: Only samples at or after this timestamp
+        :param end: Only samples before this timestamp
+        :returns: A dict of name to float64 array, plus 'time'
+        '''
+        from pyepsolartracer.batch import BlockDecoder
+        records = self.records
+        if start is not None or end is not None:
+            times = records['time']
+            first = 0 if start is None else np.searchsorted(times, start, 'left')
+            last = len(times) if end is None else np.searchsorted(times, end, 'left')
+            records = records[first:last]
+        if names is None:
+            names = self.names
+        columns = {'time': np.array(records['time'])}
+        valid = np.unpackbits(records['flags'], axis = 1, bitorder = 'little') if len(records) else None
+        # a view into the mapped file
+        words = records['words']
+        words_registers = []
+        words_offsets = []
+        index = {name: i for i, name in enumerate(self.names)}
+        for name in names:
+            i = index.get(name)
+            if i is None:
+                columns[name] = np.full(len(records), np.nan)
+                continue
+            reg = self.layout.registers[i]
+            if reg.is_coil() or reg.is_discrete_input():
+                columns[name] = (words[:, self.layout.offsets[i]] & 1).astype(np.float64)
+            else:
+                words_registers.append(reg)
+                words_offsets.append(self.layout.offsets[i])
+        if words_registers:
+            # take out only the words of these registers, halves stay next to each other
+            used = sorted(set(offset + i for reg, offset in zip(words_registers, words_offsets)
+                              for i in range(reg.size)))
+            position = {offset: j for j, offset in enumerate(used)}
+            decoded = BlockDecoder(0, words_registers, [position[offset] for offset in words_offsets]) \
+                .decode_array(words[:, used])
+            for j, reg in enumerate(words_registers):
+                columns[reg.name] = decoded[:, j]
+        for name in names:
+            if valid is not None and name in index:
+                columns[name][valid[:, index[name]] == 0] = np.nan
+        return columns
+
+
+class StoreSink(Sink):
+    ''' Poller sink writing to a sample store
+    '''
+
+    def __init__(self, path, names):
+        self.writer = StoreWriter(path, names)
+
+    def write(self, timestamp, values):
+        self.writer.append(timestamp, values)
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+__all__ = [
+    "StoreWriter",
+    "StoreReader",
+    "StoreSink",
+]
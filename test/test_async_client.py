@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+
+from pyepsolartracer.asyncclient import AsyncEPsolarTracerClient
+from pyepsolartracer.client import EPsolarTracerClient, EPChargerState
+from pyepsolartracer.registers import registers
+from test.testdata import AsyncModbusMockClient, ModbusImageMockClient
+
+
+class TestAsyncClient(unittest.TestCase):
+    """Test for the asyncio client against the mock transports"""
+
+    def test_read_input(self):
+        async def run():
+            client = AsyncEPsolarTracerClient(serialclient = AsyncModbusMockClient())
+            await client.connect()
+            return [await client.read_input("Charging equipment rated input voltage"),
+                    await client.read_input("Manual control the load"),
+                    await client.read_input("Day/Night")]
+        values = asyncio.run(run())
+        self.assertEqual([v.value for v in values], [150.0, True, True])
+
+    def test_read_device_info(self):
+        client = AsyncEPsolarTracerClient(serialclient = AsyncModbusMockClient())
+        response = asyncio.run(client.read_device_info())
+        self.assertEqual(response.information[1], b'Tracer2215BN')
+
+    def test_read_many_matches_blocking_client(self):
+        names = [reg.name for reg in registers]
+        expected = EPsolarTracerClient(serialclient = ModbusImageMockClient()).read_many(names)
+        client = AsyncEPsolarTracerClient(serialclient = AsyncModbusMockClient(ModbusImageMockClient()))
+        values = asyncio.run(client.read_many(names))
+        self.assertEqual([v.value for v in values], [v.value for v in expected])
+
+    def test_concurrent_clients(self):
+        mocks = [ModbusImageMockClient() for i in range(3)]
+        clients = [AsyncEPsolarTracerClient(serialclient = AsyncModbusMockClient(m)) for m in mocks]
+        async def run():
+            return await asyncio.gather(*[c.read_all() for c in clients])
+        results = asyncio.run(run())
+        self.assertEqual(len(results), 3)
+        for mock in mocks:
+            self.assertEqual(mock.transactions, mocks[0].transactions)
+        self.assertEqual(results[0][-1].value, True)
+
+    def test_state_decoders_are_shared(self):
+        client = AsyncEPsolarTracerClient(serialclient = AsyncModbusMockClient())
+        self.assertListEqual([EPChargerState.CHARGE_FLOAT], client.parse_charger_state(0x5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from pyepsolartracer.blocks import plan_reads
+from pyepsolartracer.registers import registers
+from pyepsolartracer.client import EPBatteryFlag, EPChargerFlag, battery_state_flags, charger_state_flags
+from test.testdata import registerImage
+
+try:
+    import numpy as np
+    from pyepsolartracer.batch import BlockDecoder, decode_block, battery_state_masks, charger_state_masks
+except ImportError:
+    np = None
+
+
+def block_words(block):
+    function = 4 if block.registers[0].is_input_register() else 3
+    return [registerImage[(function, block.address + i)] for i in range(block.count)]
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestBlockDecoder(unittest.TestCase):
+    """Test for the vectorized block decoder"""
+
+    def test_matches_register_decode(self):
+        for block in plan_reads(registers):
+            words = block_words(block)
+            columns = decode_block(block, words)
+            for reg in block.registers:
+                offset = reg.address - block.address
+                expected = reg.decode_words(words[offset:offset + reg.size]).value
+                self.assertAlmostEqual(float(columns[reg.name]), expected, msg = reg.name)
+
+    def test_many_samples(self):
+        block = plan_reads(registers)[3]
+        decoder = BlockDecoder.for_block(block)
+        words = np.array([block_words(block)] * 5, dtype = np.uint16)
+        words[2, 0x1b] = 0x0064  # Battery Current L
+        words[2, 0x1c] = 0x0000  # Battery Current H
+        columns = decoder.decode(words)
+        self.assertEqual(columns["Battery Current"].shape, (5,))
+        self.assertEqual(list(columns["Battery Current"]), [-1.0, -1.0, 1.0, -1.0, -1.0])
+        records = decoder.decode_records(words)
+        self.assertEqual(records.shape, (5,))
+        self.assertEqual(records["Battery Current"][2], 1.0)
+
+    def test_short_block(self):
+        decoder = BlockDecoder.for_block(plan_reads(registers)[0])
+        self.assertRaises(ValueError, decoder.decode, [0, 0])
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestStateMasks(unittest.TestCase):
+
+    def test_matches_flags(self):
+        states = np.arange(0x10000)
+        battery = battery_state_masks(states)
+        charger = charger_state_masks(states)
+        for state in range(0, 0x10000, 7):
+            self.assertEqual(battery[state], battery_state_flags(state))
+            self.assertEqual(charger[state], charger_state_flags(state))
+
+    def test_fault_window(self):
+        history = np.array([0x0000, 0x0010, 0x0010, 0x0000, 0x10000])
+        hot = (battery_state_masks(history) & EPBatteryFlag.HOT) != 0
+        self.assertListEqual(hot.tolist(), [False, True, True, False, False])
+        self.assertEqual(battery_state_masks(history)[-1], EPBatteryFlag.INVALID_VALUE)
+        masks = charger_state_masks(np.array([[0x0009, 0x0001]]))
+        self.assertEqual(masks.shape, (1, 2))
+        self.assertEqual(masks[0, 0], EPChargerFlag.CHARGE_BOOST)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 
-from pyepsolartracer.client import EPsolarTracerClient, EPBatteryState
+from pyepsolartracer.client import EPsolarTracerClient, EPBatteryFlag, EPBatteryState
 
 
 class TestBatteryParsing(unittest.TestCase):
@@ -45,6 +45,14 @@ class TestBatteryParsing(unittest.TestCase):
         self.assertIn(EPBatteryState.INVALID_VALUE, ret)
 
 
+    def test_battery_state_flags(self):
+        for state, expected in [(0x0, EPBatteryFlag.NORMAL), (0x3 | (0x1 << 4), EPBatteryFlag.UNDERVOLT_DISCONNECT | EPBatteryFlag.HOT)]:
+            self.assertEqual(expected, self.epsolar_client.battery_state_flags(state))
+        # lists come from a table, callers must not be able to change it
+        ret = self.epsolar_client.parse_battery_state(0x0)
+        ret.append(None)
+        self.assertNotIn(None, self.epsolar_client.parse_battery_state(0x0))
+
 
 
 if __name__ == '__main__':
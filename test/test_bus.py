@@ -0,0 +1,69 @@
+import time
+import unittest
+
+from pyepsolartracer.bus import BusScheduler, interframe_gap
+from test.testdata import ModbusImageMockClient
+
+
+class TestBusScheduler(unittest.TestCase):
+    """Test for sharing one bus between several units"""
+
+    def setUp(self):
+        self.mock = ModbusImageMockClient()
+        self.bus = BusScheduler(serialclient = self.mock, gap = 0)
+
+    def test_interframe_gap(self):
+        self.assertAlmostEqual(interframe_gap(9600), 0.00401, places = 5)
+        self.assertEqual(interframe_gap(115200), 0.00175)
+
+    def test_gap_from_client_baudrate(self):
+        from pymodbus.client import ModbusSerialClient
+        from pyepsolartracer.rtu import RtuClient
+        self.assertEqual(BusScheduler(serialclient = ModbusImageMockClient(baudrate = 9600)).gap, interframe_gap(9600))
+        serialclient = ModbusSerialClient(method = 'rtu', port = '/dev/null', baudrate = 9600)
+        self.assertEqual(BusScheduler(serialclient = serialclient).gap, interframe_gap(9600))
+        self.assertEqual(BusScheduler(serialclient = RtuClient('/dev/null', 9600)).gap, interframe_gap(9600))
+        with self.assertRaises(ValueError):
+            BusScheduler(serialclient = object())
+
+    def test_round_robin(self):
+        order = []
+        def job(client):
+            order.append(client.unit)
+        # unit 1 is chatty, the others must not wait for all of its jobs
+        for i in range(4):
+            self.bus.submit(1, job)
+        self.bus.submit(2, job)
+        self.bus.submit(3, job)
+        self.bus.run_pending()
+        self.assertEqual(order, [1, 2, 3, 1, 1, 1])
+
+    def test_futures(self):
+        soc = self.bus.read_input(2, "Battery SOC")
+        many = self.bus.read_many(3, ["Battery SOC", "Charging equipment input voltage"])
+        failed = self.bus.read_input(4, "No such register")
+        self.bus.run_pending()
+        self.assertEqual(soc.result().value, 87)
+        self.assertEqual([v.value for v in many.result()], [87, 48.3])
+        self.assertRaises(Exception, failed.result)
+
+    def test_gap_between_jobs(self):
+        bus = BusScheduler(serialclient = self.mock, gap = 0.02)
+        for unit in (1, 2, 3):
+            bus.read_input(unit, "Battery SOC")
+        start = time.monotonic()
+        bus.run_pending()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_worker_thread(self):
+        self.bus.start()
+        try:
+            futures = [self.bus.read_input(unit, "Battery SOC") for unit in range(1, 7)]
+            self.assertEqual([f.result(timeout = 5).value for f in futures], [87] * 6)
+        finally:
+            self.bus.stop()
+        self.assertEqual(self.bus.pending(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
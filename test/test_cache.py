@@ -0,0 +1,89 @@
+import datetime
+import unittest
+
+from pyepsolartracer.cache import ReadCache
+from pyepsolartracer.client import EPsolarTracerClient, clock_values
+from pyepsolartracer.registers import registerByName
+from test.testdata import ModbusImageMockClient
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestReadCache(unittest.TestCase):
+    """Test for the TTL read cache of the client"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ReadCache(clock = self.clock)
+        self.mock = ModbusImageMockClient()
+        self.epsolar_client = EPsolarTracerClient(serialclient = self.mock, cache = self.cache)
+
+    def test_ttl_by_range_and_override(self):
+        self.assertIsNone(self.cache.ttl(registerByName("Charging equipment rated input voltage")))
+        self.assertEqual(self.cache.ttl(registerByName("Battery SOC")), 1)
+        self.assertEqual(self.cache.ttl(registerByName("Maximum battery volt today")), 60)
+        self.assertEqual(self.cache.ttl(registerByName("Manual control the load")), 0)
+        cache = ReadCache(overrides = {"Battery SOC": 30})
+        self.assertEqual(cache.ttl(registerByName("Battery SOC")), 30)
+
+    def test_real_time_values_in_statistics_range(self):
+        for name in ["Battery Current", "Battery Current L", "Battery Temp.", "Ambient Temp."]:
+            self.assertEqual(self.cache.ttl(registerByName(name)), 1, name)
+        self.assertEqual(self.cache.ttl(registerByName("Carbon dioxide reduction H")), 60)
+
+    def test_clock_not_cached(self):
+        first = datetime.datetime(2024, 5, 1, 12, 0, 0)
+        self.assertTrue(self.epsolar_client.sync_clock(first))
+        self.assertEqual(self.epsolar_client.read_clock(), first)
+        # the device clock moves on by itself
+        later = datetime.datetime(2024, 5, 1, 13, 0, 0)
+        for name, value in clock_values(later).items():
+            self.mock.image[(3, registerByName(name).address)] = value
+        self.clock.now += 3600
+        transactions = self.mock.transactions
+        self.assertEqual(self.epsolar_client.read_clock(), later)
+        self.assertEqual(self.mock.transactions, transactions + 1)
+
+    def test_expiry(self):
+        self.epsolar_client.read_input("Battery SOC")
+        self.epsolar_client.read_input("Battery SOC")
+        self.assertEqual(self.mock.transactions, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.clock.now = 1.5
+        self.epsolar_client.read_input("Battery SOC")
+        self.assertEqual(self.mock.transactions, 2)
+
+    def test_rated_data_never_expires(self):
+        self.epsolar_client.read_input("Charging equipment rated input voltage")
+        self.clock.now = 1e9
+        self.epsolar_client.read_input("Charging equipment rated input voltage")
+        self.assertEqual(self.mock.transactions, 1)
+
+    def test_halves_filled_from_same_response(self):
+        self.epsolar_client.read_input("Battery Current H")
+        self.assertEqual(self.epsolar_client.read_input("Battery Current").value, -1.0)
+        self.assertEqual(self.epsolar_client.read_input("Battery Current L").value, -1.0)
+        self.assertEqual(self.mock.transactions, 1)
+
+    def test_read_many_only_reads_misses(self):
+        self.epsolar_client.read_input("Battery Type")
+        self.epsolar_client.read_many(["Battery Type", "Battery Capacity"])
+        self.assertEqual(self.mock.transactions, 2)
+        self.epsolar_client.read_many(["Battery Type", "Battery Capacity"])
+        self.assertEqual(self.mock.transactions, 2)
+
+    def test_write_invalidates(self):
+        self.epsolar_client.read_input("Battery Capacity")
+        self.epsolar_client.write_output("Battery Capacity", 100)
+        self.assertIsNone(self.cache.get(registerByName("Battery Capacity")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from pyepsolartracer.changes import ChangeFilter, ChangeSink
+from pyepsolartracer.poll import CallbackSink
+from pyepsolartracer.registers import registerByName, Value
+
+
+def value(name, v):
+    # Value scales raw values, give it one
+    register = registerByName(name)
+    return Value(register, None if v is None else round(v * register.times))
+
+
+class TestChangeFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.filter = ChangeFilter(heartbeat = 60, overrides = {"Battery Current": (0.0, 0.1)})
+
+    def names(self, timestamp, values):
+        return [v.register.name for v in self.filter.filter(timestamp, values)]
+
+    def test_deadbands(self):
+        voltage = "Charging equipment input voltage"
+        status = "Charging equipment status"
+        self.assertEqual(self.names(0, [value(voltage, 48.30), value(status, 9)]), [voltage, status])
+        self.assertEqual(self.names(10, [value(voltage, 48.33), value(status, 9)]), [])
+        # compared with the last value passed on, not the last one seen
+        self.assertEqual(self.names(20, [value(voltage, 48.35), value(status, 9)]), [voltage])
+        self.assertEqual(self.names(30, [value(voltage, 48.35), value(status, 11)]), [status])
+
+    def test_relative_override(self):
+        current = "Battery Current"
+        self.assertEqual(self.names(0, [value(current, 10.0)]), [current])
+        self.assertEqual(self.names(1, [value(current, 10.9)]), [])
+        self.assertEqual(self.names(2, [value(current, 11.0)]), [current])
+
+    def test_missing_values_and_heartbeat(self):
+        soc = "Battery SOC"
+        self.assertEqual(self.names(0, [value(soc, 80)]), [soc])
+        self.assertEqual(self.names(10, [value(soc, None)]), [soc])
+        self.assertEqual(self.names(20, [value(soc, None)]), [])
+        self.assertEqual(self.names(30, [value(soc, 80)]), [soc])
+        self.assertEqual(self.names(60, [value(soc, 80)]), [])
+        self.assertEqual(self.names(90, [value(soc, 80)]), [soc])
+        self.filter.reset()
+        self.assertEqual(self.names(91, [value(soc, 80)]), [soc])
+
+
+class TestChangeSink(unittest.TestCase):
+
+    def test_quiet_cycles_are_dropped(self):
+        received = []
+        sink = ChangeSink([CallbackSink(lambda t, values: received.append((t, len(values))))])
+        values = [value("Battery SOC", 80), value("Day/Night", True)]
+        sink.write(0, values)
+        sink.write(10, values)
+        sink.write(20, [value("Battery SOC", 80), value("Day/Night", False)])
+        self.assertEqual(received, [(0, 2), (20, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 
-from pyepsolartracer.client import EPsolarTracerClient, EPChargerState
+from pyepsolartracer.client import EPsolarTracerClient, EPChargerFlag, EPChargerState
 
 
 class TestChargerParsing(unittest.TestCase):
@@ -84,6 +84,14 @@ class TestChargerParsing(unittest.TestCase):
         ret = self.epsolar_client.parse_charger_state(0xFFFFFFFF)
         self.assertIn(EPChargerState.INVALID_VALUE, ret)
 
+    def test_charger_state_flags(self):
+        for state, expected in [(0x1, EPChargerFlag.CHARGE_STOP), (0x8, EPChargerFlag.CHARGE_BOOST | EPChargerFlag.STANDBY)]:
+            self.assertEqual(expected, self.epsolar_client.charger_state_flags(state))
+        # lists come from a table, callers must not be able to change it
+        ret = self.epsolar_client.parse_charger_state(0x0)
+        ret.append(None)
+        self.assertNotIn(None, self.epsolar_client.parse_charger_state(0x0))
+
 
 
 if __name__ == '__main__':
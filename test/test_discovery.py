@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+
+from pyepsolartracer.client import EPsolarTracerClient
+from pyepsolartracer.discovery import CapabilityMap, discover, device_identity, load_capabilities
+from pyepsolartracer.registers import registerByName, registers, coils
+from pyepsolartracer.blocks import plan_reads, COIL, DISCRETE_INPUT, INPUT_REGISTER
+from test.testdata import ModbusImageMockClient
+
+
+class TestDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.mock = ModbusImageMockClient()
+        # a model without battery temperature, and a hole it does not answer
+        del self.mock.image[(4, 0x3110)]
+        del self.mock.image[(4, 0x3109)]
+        self.epsolar_client = EPsolarTracerClient(serialclient = self.mock)
+
+    def test_discover(self):
+        capabilities = discover(self.epsolar_client)
+        self.assertFalse(capabilities.supports(registerByName("Battery Temperature")))
+        self.assertIn((INPUT_REGISTER, 0x3109), capabilities.unsupported)
+        self.assertIn((INPUT_REGISTER, 0x3110), capabilities.unsupported)
+        for reg in registers + coils:
+            if reg.name != "Battery Temperature":
+                self.assertTrue(capabilities.supports(reg), reg.name)
+
+    def flaky(self, address, timeouts):
+        ''' Lets blocks covering an input register address time out a number of times
+        '''
+        from pymodbus.exceptions import ModbusIOException
+        read_block = self.epsolar_client.read_block
+        left = [timeouts]
+
+        def flaky_read_block(block):
+            if block.kind == INPUT_REGISTER and block.address <= address < block.address + block.count \
+                    and left[0] > 0:
+                left[0] -= 1
+                return ModbusIOException("timeout")
+            return read_block(block)
+        self.epsolar_client.read_block = flaky_read_block
+        return left
+
+    def test_timeouts_read_again(self):
+        left = self.flaky(0x311A, 3)
+        capabilities = discover(self.epsolar_client)
+        self.assertEqual(left, [0])
+        self.assertTrue(capabilities.supports(registerByName("Battery SOC")))
+        self.assertEqual(capabilities.unsupported, discover(self.epsolar_client).unsupported)
+
+    def test_persistent_timeouts_marked(self):
+        # some firmware does not answer at all
+        self.flaky(0x311A, 1000)
+        capabilities = discover(self.epsolar_client)
+        self.assertFalse(capabilities.supports(registerByName("Battery SOC")))
+        self.assertTrue(capabilities.supports(registerByName("Charging equipment input voltage")))
+
+    def test_answered_holes_bridged(self):
+        # the device rejects one address between the discrete inputs
+        del self.mock.image[(2, 0x2005)]
+        capabilities = discover(self.epsolar_client)
+        self.assertIn((COIL, 0x0003), capabilities.answered)
+        self.assertIn((COIL, 0x0004), capabilities.answered)
+        self.assertIn((DISCRETE_INPUT, 0x2005), capabilities.unsupported)
+        self.assertNotIn((DISCRETE_INPUT, 0x2005), capabilities.answered)
+        self.assertEqual(CapabilityMap.from_dict(capabilities.to_dict()).answered, capabilities.answered)
+        self.epsolar_client.capabilities = capabilities
+        self.mock.transactions = 0
+        values = self.epsolar_client.read_many([reg.name for reg in coils])
+        # all coils in one block, the discrete inputs around the rejected address in two
+        self.assertEqual(self.mock.transactions, 3)
+        self.assertEqual(values[0].value, True)
+        self.assertTrue(all(value.value is not None for value in values))
+
+    def test_scans_skip_unsupported(self):
+        names = [reg.name for reg in registers]
+        self.epsolar_client.read_many(names)
+        without = self.mock.transactions
+        self.epsolar_client.capabilities = discover(self.epsolar_client)
+        self.mock.transactions = 0
+        values = self.epsolar_client.read_many(names)
+        self.assertLess(self.mock.transactions, without)
+        # no block fails and has to be read register by register
+        capabilities = self.epsolar_client.capabilities
+        blocks = plan_reads([reg for reg in registers if capabilities.supports(reg)], avoid = capabilities.unsupported)
+        self.assertEqual(self.mock.transactions, len(blocks))
+        byName = {value.register.name: value.value for value in values}
+        self.assertIsNone(byName["Battery Temperature"])
+        self.assertEqual(byName["Battery SOC"], 87)
+        self.assertIsNone(self.epsolar_client.read_input("Battery Temperature").value)
+        self.assertEqual(self.mock.transactions, len(blocks))
+
+    def test_cached_on_disk(self):
+        self.assertEqual(device_identity(self.epsolar_client), ("Tracer2215BN", "V02.05+V07.12"))
+        with tempfile.TemporaryDirectory() as directory:
+            first = load_capabilities(self.epsolar_client, directory)
+            self.assertEqual(os.listdir(directory), ["Tracer2215BN-V02.05+V07.12.json"])
+            self.mock.transactions = 0
+            second = load_capabilities(self.epsolar_client, directory)
+            # only the device information was read
+            self.assertEqual(self.mock.transactions, 1)
+            self.assertEqual(second.unsupported, first.unsupported)
+            self.assertEqual(second.model, "Tracer2215BN")
+            path = os.path.join(directory, os.listdir(directory)[0])
+            self.assertEqual(CapabilityMap.load(path).to_dict(), first.to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
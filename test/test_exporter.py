@@ -0,0 +1,58 @@
+import unittest
+import urllib.request
+
+from pyepsolartracer.client import EPsolarTracerClient
+from pyepsolartracer.exporter import Exporter, Snapshot
+from pyepsolartracer.poll import Poller
+from pyepsolartracer.metrics import TransactionMetrics
+from pyepsolartracer.registers import registers
+from test.testdata import ModbusImageMockClient
+
+
+class TestExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.mock = ModbusImageMockClient()
+        client = EPsolarTracerClient(serialclient = self.mock)
+        self.snapshot = Snapshot()
+        self.poller = Poller(client, [reg.name for reg in registers], sinks = [self.snapshot],
+                             wallclock = lambda: 1700000000.0)
+
+    def test_render(self):
+        self.poller.poll_once()
+        exporter = Exporter(self.snapshot, self.poller, ('127.0.0.1', 0), TransactionMetrics())
+        try:
+            lines = exporter.metrics().split("\n")
+        finally:
+            exporter.close()
+        self.assertIn('epsolar_register{name="Battery SOC",address="0x311a",unit="%"} 87.0', lines)
+        self.assertIn('epsolar_register{name="Battery Current",address="0x331b",unit="A"} -1.0', lines)
+        self.assertIn('epsolar_battery_state{state="NORMAL"} 1', lines)
+        self.assertIn('epsolar_charger_state{state="FAULT"} 0', lines)
+        self.assertIn('epsolar_sample_timestamp_seconds 1700000000.0', lines)
+        self.assertIn('epsolar_poll_cycles_total 1', lines)
+        self.assertIn('epsolar_up 1', lines)
+        self.assertIn('epsolar_bus_utilization 0.0', lines)
+
+    def test_scrapes_do_not_read(self):
+        self.poller.poll_once()
+        transactions = self.mock.transactions
+        exporter = Exporter(self.snapshot, self.poller, ('127.0.0.1', 0))
+        exporter.start()
+        try:
+            url = 'http://127.0.0.1:%d/metrics' % exporter.address[1]
+            for i in range(3):
+                with urllib.request.urlopen(url) as response:
+                    body = response.read().decode('utf-8')
+                    self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+                self.assertIn('name="Battery SOC"', body)
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen('http://127.0.0.1:%d/' % exporter.address[1])
+        finally:
+            exporter.close()
+        self.assertEqual(exporter.scrapes, 3)
+        self.assertEqual(self.mock.transactions, transactions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+import unittest
+
+# Budget for the time spent in our own modules when importing the client,
+# in microseconds as reported by python -X importtime
+IMPORT_BUDGET_US = 50000
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module):
+    """Returns {module: (self us, cumulative us)} for a fresh import of module"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd = ROOT, capture_output = True, text = True, check = True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    """Importing the package must stay cheap for CLI and cron use"""
+
+    def check(self, module):
+        times = import_times(module)
+        self.assertFalse([name for name in times if name.startswith('pymodbus')],
+                         "pymodbus must only be imported when connecting")
+        self.assertNotIn('pyepsolartracer._registertable', times,
+                         "the register table must only be built when used")
+        own = sum(t[0] for name, t in times.items() if name.startswith('pyepsolartracer'))
+        self.assertLess(own, IMPORT_BUDGET_US)
+
+    def test_client(self):
+        self.check('pyepsolartracer.client')
+
+    def test_poll(self):
+        self.check('pyepsolartracer.poll')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import calendar
+import io
+import unittest
+
+from pyepsolartracer.logdata import load_log, parse_date
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LOG = """Sat Jun  3 14:05:01 BST 2023
+Charging equipment input power = 69.56W
+Battery SOC = 87%
+Battery Temperature = -2.0ï¿½C
+
+Sat Jun  3 14:05:11 BST 2023
+Charging equipment input power = None
+Battery SOC = 88%
+
+Sat Jun  3 14:05:21 BST 2023
+Battery SOC = 89%
+Day/Night = True
+
+"""
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestLogLoader(unittest.TestCase):
+    """Test for loading the text log into columns"""
+
+    def test_parse_date(self):
+        expected = calendar.timegm((2023, 6, 3, 13, 5, 1))
+        self.assertEqual(parse_date("Sat Jun  3 14:05:01 BST 2023", 3600), expected)
+        self.assertEqual(parse_date("Sat Jun  3 14:05:01 2023", 3600), expected)
+        self.assertEqual(parse_date("2023-06-03T14:05:01+01:00"), expected)
+        self.assertIsNone(parse_date("Battery SOC = 87%"))
+
+    def test_columns(self):
+        columns = load_log(io.StringIO(LOG), utcoffset = 0)
+        self.assertEqual(list(columns['time'] - columns['time'][0]), [0, 10, 20])
+        self.assertEqual(list(columns["Battery SOC"]), [87, 88, 89])
+        self.assertEqual(columns["Battery Temperature"][0], -2.0)
+        self.assertTrue(np.isnan(columns["Charging equipment input power"][1]))
+        self.assertTrue(np.isnan(columns["Charging equipment input power"][2]))
+        self.assertEqual(columns["Day/Night"][2], 1.0)
+
+    def test_names_and_range(self):
+        start = calendar.timegm((2023, 6, 3, 14, 5, 5))
+        columns = load_log(io.StringIO(LOG), ["Battery SOC", "Ambient Temp."], start = start, utcoffset = 0)
+        self.assertEqual(sorted(columns), ["Ambient Temp.", "Battery SOC", "time"])
+        self.assertEqual(list(columns["Battery SOC"]), [88, 89])
+        self.assertTrue(np.isnan(columns["Ambient Temp."]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+from pyepsolartracer.client import EPsolarTracerClient
+from pyepsolartracer.exporter import render_transactions
+from pyepsolartracer.metrics import TransactionMetrics, frame_sizes, OK, EXCEPTION, TIMEOUT
+from pyepsolartracer.registers import registers
+from test.testdata import ModbusImageMockClient
+
+
+class SilentMockClient(ModbusImageMockClient):
+    """Does not answer reads of some addresses at all"""
+
+    def __init__(self, silent, **kwargs):
+        ModbusImageMockClient.__init__(self, **kwargs)
+        self.silent = silent
+
+    def send(self, request):
+        length = ModbusImageMockClient.send(self, request)
+        if int.from_bytes(request[2:4], 'big') in self.silent:
+            self.data = b''
+        return length
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = TransactionMetrics()
+
+    def test_frame_sizes(self):
+        self.assertEqual(frame_sizes(4, 15, OK), (8, 35))
+        self.assertEqual(frame_sizes(2, 1, OK), (8, 6))
+        self.assertEqual(frame_sizes(16, 3, OK), (15, 8))
+        self.assertEqual(frame_sizes(3, 1, EXCEPTION), (8, 5))
+        self.assertEqual(frame_sizes(3, 1, TIMEOUT), (8, 0))
+
+    def test_client_records_transactions(self):
+        mock = ModbusImageMockClient()
+        client = EPsolarTracerClient(serialclient = mock, metrics = self.metrics)
+        client.read_many([reg.name for reg in registers])
+        client.read_input("Charging equipment input voltage")
+        client.write_output("Battery Capacity", 100)
+        total = self.metrics.total()
+        self.assertEqual(total.count, mock.transactions)
+        self.assertEqual(total.bytes_sent, mock.bytes_sent)
+        self.assertEqual(total.bytes_received, mock.bytes_received)
+        self.assertEqual(self.metrics.stats[(1, 4)].count, 5)
+        self.assertEqual(self.metrics.stats[(1, 16)].count, 1)
+        self.assertEqual(sum(total.histogram), total.count)
+        self.assertEqual(total.exceptions, 0)
+        self.assertGreater(self.metrics.utilization(), 0.0)
+
+        del mock.image[(3, 0x9000)]
+        client.read_input("Battery Type")
+        self.assertEqual(self.metrics.total().exceptions, 1)
+
+    def test_timeouts_and_retries(self):
+        mock = SilentMockClient({0x311A})
+        client = EPsolarTracerClient(serialclient = mock, metrics = self.metrics, retries = 2)
+        self.assertIsNone(client.read_input("Battery SOC").value)
+        stats = self.metrics.stats[(1, 4)]
+        self.assertEqual((stats.count, stats.timeouts, stats.retries), (3, 3, 2))
+        self.assertEqual(client.read_input("Charging equipment input voltage").value, 48.3)
+        self.assertEqual(self.metrics.stats[(1, 4)].count, 4)
+
+    def test_render(self):
+        self.metrics.record(1, 4, 2, 0.015, None)
+        self.metrics.record(2, 4, 2, 0.003, None)
+        lines = render_transactions(self.metrics).split("\n")
+        self.assertIn('epsolar_transaction_seconds_bucket{unit="1",function="4",le="0.01"} 0', lines)
+        self.assertIn('epsolar_transaction_seconds_bucket{unit="1",function="4",le="0.02"} 1', lines)
+        self.assertIn('epsolar_transaction_seconds_bucket{unit="1",function="4",le="+Inf"} 1', lines)
+        self.assertIn('epsolar_transaction_timeouts_total{unit="2",function="4"} 1', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
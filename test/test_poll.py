@@ -0,0 +1,119 @@
+import io
+import unittest
+
+from pyepsolartracer.client import EPsolarTracerClient
+from pyepsolartracer.poll import Poller, TextSink, CallbackSink, AdaptiveInterval
+from test.testdata import ModbusImageMockClient
+
+
+class FakeTime:
+    """Clock and sleep, where every read takes some time"""
+
+    def __init__(self, read_time = 0.0):
+        self.now = 100.0
+        self.read_time = read_time
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FailingClient(EPsolarTracerClient):
+
+    def __init__(self, fail, **kwargs):
+        EPsolarTracerClient.__init__(self, **kwargs)
+        self.fail = fail
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        return True
+
+    def read_many(self, names):
+        if self.fail:
+            self.fail -= 1
+            raise IOError("port gone")
+        return EPsolarTracerClient.read_many(self, names)
+
+
+class TestPoller(unittest.TestCase):
+    """Test for the long running poller"""
+
+    def setUp(self):
+        self.time = FakeTime()
+        self.samples = []
+        self.mock = ModbusImageMockClient()
+        self.epsolar_client = EPsolarTracerClient(serialclient = self.mock)
+
+    def poller(self, client, interval = 10, policy = None):
+        def read_many(names, read = client.read_many):
+            self.time.now += self.time.read_time
+            return read(names)
+        client.read_many = read_many
+        return Poller(client, ["Battery SOC", "Charging equipment input voltage"], interval,
+                      [CallbackSink(lambda t, values: self.samples.append(values))],
+                      clock = self.time.clock, sleep = self.time.sleep, wallclock = self.time.clock,
+                      policy = policy)
+
+    def test_schedule_does_not_drift(self):
+        self.time.read_time = 0.3
+        self.poller(self.epsolar_client).run(cycles = 4)
+        self.assertEqual(len(self.samples), 4)
+        self.assertEqual([round(s, 6) for s in self.time.sleeps], [9.7, 9.7, 9.7])
+
+    def test_overrun_skips_slots(self):
+        self.time.read_time = 25
+        self.poller(self.epsolar_client).run(cycles = 3)
+        self.assertEqual([round(s, 6) for s in self.time.sleeps], [5, 5])
+
+    def test_reconnect_after_failure(self):
+        client = FailingClient(1, serialclient = self.mock)
+        poller = self.poller(client)
+        poller.run(cycles = 3)
+        self.assertEqual(poller.failures, 1)
+        self.assertEqual(poller.cycles, 2)
+        self.assertEqual(client.connects, 2)
+        self.assertEqual(self.samples[0][0].value, 87)
+
+    def test_adaptive_interval(self):
+        poller = self.poller(self.epsolar_client, policy = AdaptiveInterval(10, 60))
+        image = self.mock.image
+        # night (Day/Night = True in the image), not charging
+        image[(4, 0x3201)] = 0x0001
+        poller.run(cycles = 5)
+        self.assertEqual([round(s, 6) for s in self.time.sleeps], [10, 20, 40, 60])
+        # the sinks only get the poller's own registers
+        self.assertEqual(len(self.samples[0]), 2)
+        # sunrise, then boost charging in daylight
+        image[(2, 0x200C)] = 0
+        self.time.sleeps = []
+        poller.run(cycles = 2)
+        image[(4, 0x3201)] = 0x0009
+        poller.run(cycles = 2)
+        self.assertEqual([round(s, 6) for s in self.time.sleeps], [10, 10])
+
+    def test_adaptive_interval_faults(self):
+        policy = AdaptiveInterval(5, 100, growth = 10)
+        night = self.epsolar_client.read_many(AdaptiveInterval.names)
+        self.assertEqual(policy.next_interval(night), 5)
+        self.assertEqual(policy.next_interval(night), 50)
+        self.assertEqual(policy.next_interval(None), 5)
+        self.mock.image[(4, 0x3201)] = 0x0003
+        fault = self.epsolar_client.read_many(AdaptiveInterval.names)
+        self.assertEqual(policy.next_interval(fault), 5)
+        self.assertEqual(policy.next_interval(fault), 5)
+
+    def test_text_sink(self):
+        stream = io.StringIO()
+        values = self.epsolar_client.read_many(["Battery SOC"])
+        TextSink(stream).write(0, values)
+        lines = stream.getvalue().split("\n")
+        self.assertEqual(lines[1:], ["Battery SOC = 87%", "", ""])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+
+from pyepsolartracer.client import EPsolarTracerClient
+from pyepsolartracer.profile import Profile, settings_names
+from pyepsolartracer.registers import registerByName
+from test.testdata import ModbusImageMockClient
+
+
+class TestProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.mock = ModbusImageMockClient()
+        self.epsolar_client = EPsolarTracerClient(serialclient = self.mock)
+
+    def test_read_save_load(self):
+        profile = Profile.read(self.epsolar_client)
+        self.assertEqual(list(profile.values), settings_names())
+        self.assertNotIn("Real time clock 1", profile.values)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "settings.json")
+            profile.save(path)
+            self.assertEqual(Profile.load(path).values, profile.values)
+
+    def test_apply_writes_only_differences(self):
+        profile = Profile.read(self.epsolar_client)
+        profile.values["Boost voltage"] = 14.6
+        profile.values["Float voltage"] = 13.7
+        profile.values["Battery Capacity"] += 0.000001
+        self.mock.transactions = 0
+        result = profile.apply(self.epsolar_client)
+        self.assertTrue(result.ok)
+        self.assertEqual(set(result.changed), {"Boost voltage", "Float voltage"})
+        self.assertEqual(len(self.mock.writes), 1)
+        # bulk read, one write, read back
+        self.assertLessEqual(self.mock.transactions, 5)
+        self.assertEqual(profile.apply(self.epsolar_client).changed, {})
+
+    def test_dry_run_and_verify(self):
+        profile = Profile({"Battery Capacity": 300})
+        self.assertIn("Battery Capacity", profile.apply(self.epsolar_client, dry_run = True).changed)
+        self.assertEqual(self.mock.writes, [])
+        # a device that takes the write but keeps its old value
+        self.mock._write = lambda request: self.mock._frame(request[0:6])
+        result = profile.apply(self.epsolar_client)
+        self.assertFalse(result.ok)
+        self.assertEqual(result.failed, ["Battery Capacity"])
+
+    def test_failed_write(self):
+        profile = Profile({"Battery Capacity": 300, "Battery Type": 2})
+        # a device rejecting the write
+        self.mock._write = lambda request: self.mock._frame(bytes([request[0], request[1] | 0x80, 4]))
+        for verify in (True, False):
+            result = profile.apply(self.epsolar_client, verify = verify)
+            self.assertFalse(result.ok)
+            self.assertEqual(sorted(result.failed), ["Battery Capacity", "Battery Type"])
+
+    def test_read_skips_missing_settings(self):
+        # a model without this setting
+        del self.mock.image[(3, registerByName("Line Impedance").address)]
+        profile = Profile.read(self.epsolar_client)
+        self.assertNotIn("Line Impedance", profile.values)
+        self.assertEqual(len(profile.values), len(settings_names()) - 1)
+        self.mock.image = {}
+        with self.assertRaises(IOError):
+            Profile.read(self.epsolar_client)
+
+    def test_partly_failed_write_verified(self):
+        profile = Profile({"Battery Capacity": 300, "Equalization charging cycle": 20})
+        write = self.mock._write
+        # the device takes the first block but rejects the second
+        self.mock._write = lambda request: self.mock._frame(bytes([request[0], request[1] | 0x80, 4])) \
+            if request[2:4] == b'\x90\x16' else write(request)
+        self.assertEqual(profile.apply(self.epsolar_client).failed, ["Equalization charging cycle"])
+        self.assertEqual(self.epsolar_client.read_input("Battery Capacity").value, 300)
+
+    def test_read_only_registers(self):
+        with self.assertRaises(ValueError):
+            Profile({"Battery SOC": 100})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import random
+import struct
+import unittest
+
+from pyepsolartracer.client import EPsolarTracerClient
+from pyepsolartracer.registers import registers, coils, registerByName, aliasesOf
+from pyepsolartracer.blocks import plan_reads, COIL, DISCRETE_INPUT, INPUT_REGISTER, HOLDING_REGISTER
+from test.testdata import ModbusImageMockClient
+
+
+class TestReadMany(unittest.TestCase):
+    """Test for the block reads of read_many/read_all"""
+
+    def setUp(self):
+        self.mock = ModbusImageMockClient()
+        self.epsolar_client = EPsolarTracerClient(serialclient = self.mock)
+
+    def test_plan_reads_groups_by_kind_and_address(self):
+        blocks = plan_reads(registers)
+        self.assertEqual([(b.kind, b.address) for b in blocks], [
+            (INPUT_REGISTER, 0x3000),
+            (INPUT_REGISTER, 0x3100),
+            (INPUT_REGISTER, 0x3200),
+            (INPUT_REGISTER, 0x3300),
+            (HOLDING_REGISTER, 0x9000),
+            (HOLDING_REGISTER, 0x903D),
+            (HOLDING_REGISTER, 0x9065),
+        ])
+        self.assertEqual(blocks[0].count, 15)
+        self.assertEqual(sum(len(b.registers) for b in blocks), len(registers))
+
+    def test_plan_reads_groups_bits(self):
+        blocks = plan_reads(coils)
+        # no undocumented addresses by default
+        self.assertEqual([(b.kind, b.address, b.count) for b in blocks], [
+            (COIL, 0x0002, 1),
+            (COIL, 0x0005, 2),
+            (DISCRETE_INPUT, 0x2000, 1),
+            (DISCRETE_INPUT, 0x200C, 1),
+        ])
+        blocks = plan_reads(coils, max_bit_gap = 11)
+        self.assertEqual([(b.kind, b.address, b.count) for b in blocks], [
+            (COIL, 0x0002, 5),
+            (DISCRETE_INPUT, 0x2000, 13),
+        ])
+
+    def test_client_max_bit_gap(self):
+        client = EPsolarTracerClient(serialclient = self.mock, max_bit_gap = 11)
+        values = client.read_many([reg.name for reg in coils])
+        self.assertEqual(self.mock.transactions, 2)
+        self.assertEqual([v.value for v in values], [v.value for v in self.epsolar_client.read_many([reg.name for reg in coils])])
+
+    def test_read_many_of_coils(self):
+        names = [reg.name for reg in coils]
+        values = self.epsolar_client.read_many(names)
+        self.assertEqual(self.mock.transactions, len(plan_reads(coils)))
+        for name, value in zip(names, values):
+            self.assertEqual(value.register.name, name)
+            self.assertEqual(value.value, self.epsolar_client.read_input(name).value)
+        self.assertEqual(values[0].value, True)
+
+    def test_plan_reads_limits(self):
+        blocks = plan_reads(registers, max_span = 16, max_gap = 0)
+        for block in blocks:
+            self.assertLessEqual(block.count, 16)
+            covered = set()
+            for reg in block.registers:
+                covered.update(range(reg.address, reg.address + reg.size))
+            self.assertEqual(covered, set(range(block.address, block.address + block.count)))
+
+    def test_decode_payload_matches_words(self):
+        rng = random.Random(24)
+        for block in plan_reads(registers):
+            for words in ([0] * block.count, [0xffff] * block.count, [0x8000] * block.count,
+                          [rng.randrange(0x10000) for i in range(block.count)]):
+                payload = memoryview(struct.pack('>%dH' % block.count, *words))
+                self.assertEqual([v.value for v in block.decode_payload(payload)],
+                                 [reg.decode_words(words[reg.address - block.address:]).value
+                                  for reg in block.registers])
+
+    def test_read_many_matches_read_input(self):
+        names = [reg.name for reg in registers]
+        values = self.epsolar_client.read_many(names)
+        transactions = self.mock.transactions
+        self.assertEqual(transactions, len(plan_reads(registers)))
+        for name, value in zip(names, values):
+            self.assertEqual(value.register.name, name)
+            self.assertEqual(value.value, self.epsolar_client.read_input(name).value)
+
+    def test_read_many_keeps_order_and_duplicates(self):
+        names = ["Battery SOC", "Charging equipment input voltage", "Battery SOC"]
+        values = self.epsolar_client.read_many(names)
+        self.assertEqual([v.register.name for v in values], names)
+        self.assertEqual(values[0].value, 87)
+        self.assertEqual(values[1].value, 48.3)
+
+    def test_read_many_falls_back_on_rejected_block(self):
+        # the device does not know one address inside the block
+        del self.mock.image[(4, 0x3109)]
+        values = self.epsolar_client.read_many(["Charging equipment input voltage", "Battery Temperature"])
+        self.assertEqual(values[0].value, 48.3)
+        self.assertEqual(values[1].value, -2.0)
+
+    def test_read_many_does_not_split_unanswered_blocks(self):
+        from pymodbus.exceptions import ModbusIOException
+        # a device that never answers
+        failed = []
+        for name in ("read_coils", "read_discrete_inputs", "read_input_registers", "read_holding_registers"):
+            setattr(self.mock, name, lambda *args, **kwargs: failed.append(args) or ModbusIOException("timeout"))
+        values = self.epsolar_client.read_all()
+        self.assertEqual(len(failed), len(plan_reads(registers + coils)))
+        self.assertTrue(all(value.value is None for value in values))
+
+    def test_aliases_share_one_transaction(self):
+        client = EPsolarTracerClient(serialclient = self.mock, max_span = 2, max_gap = 0)
+        names = ["Battery Current H", "Battery Current L", "Battery Current"]
+        values = client.read_many(names)
+        self.assertEqual(self.mock.transactions, 1)
+        self.assertEqual([v.value for v in values], [-0.01, -1.0, -1.0])
+
+    def test_read_input_of_half_reads_whole_value(self):
+        value = self.epsolar_client.read_input("Charging equipment input power H")
+        self.assertEqual(value.value, 0.0)
+        value = self.epsolar_client.read_input("Charging equipment input power L")
+        self.assertEqual(value.value, 69.56)
+        self.assertEqual([str(r) for r in aliasesOf(registerByName("Battery Current H"))],
+                         [str(registerByName(n)) for n in ["Battery Current", "Battery Current L", "Battery Current H"]])
+
+    def test_read_all(self):
+        values = self.epsolar_client.read_all()
+        self.assertEqual(values[-1].register, registerByName("Day/Night"))
+        self.assertEqual(values[-1].value, True)
+
+
+if __name__ == '__main__':
+    unittest.main()
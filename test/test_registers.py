@@ -0,0 +1,38 @@
+import unittest
+
+from pyepsolartracer.registers import registers, coils, registerByName, registersByAddress, \
+    Value, V, COIL, DISCRETE_INPUT, INPUT_REGISTER, HOLDING_REGISTER
+
+
+class TestRegisterTable(unittest.TestCase):
+    """Test for the register table"""
+
+    def test_kind(self):
+        self.assertEqual(registerByName("Manual control the load").kind, COIL)
+        self.assertEqual(registerByName("Day/Night").kind, DISCRETE_INPUT)
+        self.assertEqual(registerByName("Battery SOC").kind, INPUT_REGISTER)
+        self.assertEqual(registerByName("Battery Type").kind, HOLDING_REGISTER)
+        self.assertTrue(registerByName("Battery Type").is_holding_register())
+
+    def test_indexes(self):
+        for index, reg in enumerate(registers + coils):
+            self.assertEqual(reg.index, index)
+            self.assertIs(registerByName(reg.name), reg)
+            self.assertIn(reg, registersByAddress(reg.address))
+
+    def test_units(self):
+        reg = registerByName("Charging equipment input voltage")
+        self.assertIs(reg.unit, V)
+        self.assertEqual(reg.unit.symbol, 'V')
+        # units used to be functions
+        self.assertEqual(reg.unit()[1], 'V')
+        self.assertEqual(str(Value(reg, 1234)), "Charging equipment input voltage = 12.34V")
+
+    def test_no_instance_dict(self):
+        value = Value(registerByName("Battery SOC"), 50)
+        self.assertFalse(hasattr(value, '__dict__'))
+        self.assertFalse(hasattr(registerByName("Day/Night"), '__dict__'))
+
+
+if __name__ == '__main__':
+    unittest.main()
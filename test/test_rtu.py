@@ -0,0 +1,140 @@
+import struct
+import time
+import unittest
+
+from pyepsolartracer.client import EPsolarTracerClient
+from pyepsolartracer.discovery import discover
+from pyepsolartracer.metrics import TransactionMetrics
+from pyepsolartracer.registers import registers, coils
+from pyepsolartracer.rtu import RtuClient, AdaptiveTimeout, crc16, crc_bytes
+from pyepsolartracer.simulator import TracerSimulator
+
+
+class TestAdaptiveTimeout(unittest.TestCase):
+
+    def test_learns_turnaround(self):
+        timeout = AdaptiveTimeout(initial = 1.0, minimum = 0.01, maximum = 0.5, factor = 3, decay = 0.5)
+        self.assertEqual(timeout.timeout, 1.0)
+        timeout.observe(0.002)
+        self.assertEqual(timeout.timeout, 0.01)
+        timeout.observe(0.05)
+        self.assertAlmostEqual(timeout.timeout, 0.15)
+        # a slow answer is forgotten gradually
+        timeout.observe(0.002)
+        self.assertAlmostEqual(timeout.timeout, 0.075)
+        timeout.observe(1.0)
+        self.assertEqual(timeout.timeout, 0.5)
+
+    def test_backs_off_on_timeout(self):
+        timeout = AdaptiveTimeout(initial = 1.0, minimum = 0.02, maximum = 0.5, factor = 3)
+        timeout.timed_out()
+        self.assertEqual(timeout.timeout, 1.0)
+        timeout.observe(0.002)
+        self.assertEqual(timeout.timeout, 0.02)
+        timeout.timed_out()
+        self.assertAlmostEqual(timeout.timeout, 0.04)
+        for i in range(10):
+            timeout.timed_out()
+        self.assertAlmostEqual(timeout.timeout, 0.5)
+
+
+class TestCrc(unittest.TestCase):
+
+    def test_matches_pymodbus(self):
+        from pymodbus.utilities import computeCRC
+        for frame in [b'\x01\x04\x31\x00\x00\x12', b'\x01\x03\x90\x00\x00\x0f', b'\x01', bytes(range(256))]:
+            self.assertEqual(crc_bytes(frame), computeCRC(frame).to_bytes(2, 'big'))
+            # a whole frame checks to 0
+            self.assertEqual(crc16(frame + crc_bytes(frame)), 0)
+        self.assertEqual(crc_bytes(b'\x01\x04\x31\x00\x00\x01'), b'\x3f\x36')
+
+
+class TestRtuClient(unittest.TestCase):
+
+    def setUp(self):
+        # Battery Temperature times out, like on some firmware
+        self.simulator = TracerSimulator(turnaround = 0.002, silent = {0x3110})
+        self.simulator.open()
+        self.rtu = RtuClient(self.simulator.port, 115200)
+        self.metrics = TransactionMetrics()
+        self.epsolar_client = EPsolarTracerClient(serialclient = self.rtu, metrics = self.metrics)
+        self.assertTrue(self.epsolar_client.connect())
+
+    def tearDown(self):
+        self.epsolar_client.close()
+        self.simulator.close()
+
+    def test_reads_and_writes(self):
+        self.assertEqual(self.epsolar_client.read_input("Battery SOC").value, 87)
+        self.assertEqual(self.epsolar_client.read_input("Charging equipment output power").value, 58.26)
+        self.assertEqual(self.epsolar_client.read_input("Manual control the load").value, True)
+        self.assertTrue(self.epsolar_client.write_many({"Battery Capacity": 300, "Battery Type": 2}))
+        self.assertEqual([v.value for v in self.epsolar_client.read_many(["Battery Capacity", "Battery Type"])], [300, 2])
+        self.assertEqual(self.rtu.read_holding_registers(0x3000, 1, 1).exception_code, 2)
+        self.assertEqual(self.epsolar_client.read_device_info().information[1], b'Tracer2215BN')
+
+    def test_timing(self):
+        self.epsolar_client.read_input("Battery SOC")
+        # learned from the first answer
+        self.assertLess(self.rtu.timeout.timeout, 0.1)
+        start = time.perf_counter()
+        for i in range(10):
+            self.epsolar_client.read_input("Battery SOC")
+        self.assertLess((time.perf_counter() - start) / 10, 0.05)
+        start = time.perf_counter()
+        self.assertIsNone(self.epsolar_client.read_input("Battery Temperature").value)
+        self.assertLess(time.perf_counter() - start, 0.2)
+        self.assertEqual(self.metrics.total().timeouts, 1)
+
+    def test_late_answer_dropped(self):
+        for i in range(5):
+            self.epsolar_client.read_input("Battery SOC")
+        self.assertLess(self.rtu.timeout.timeout, 0.04)
+        self.assertTrue(self.epsolar_client.write_many({"Battery Capacity": 200, "Battery Type": 1}))
+        # one answer comes after the timeout
+        self.simulator.turnaround = 0.06
+        self.assertIsNone(self.epsolar_client.read_input("Battery Capacity").value)
+        self.simulator.turnaround = 0.002
+        self.assertEqual(self.epsolar_client.read_input("Battery Type").value, 1)
+        self.assertEqual(self.epsolar_client.read_input("Battery SOC").value, 87)
+        self.assertEqual(self.epsolar_client.read_input("Battery Capacity").value, 200)
+
+    def test_read_all(self):
+        values = self.epsolar_client.read_all()
+        self.assertEqual(len(values), len(registers) + len(coils))
+        missing = [value.register.name for value in values if value.value is None]
+        # the block without answer is not read register by register
+        self.assertIn("Battery Temperature", missing)
+        self.assertIn("Charging equipment input voltage", missing)
+        # every timeout doubles the wait, keep the discovery short
+        self.rtu.timeout.maximum = 0.1
+        self.epsolar_client.capabilities = discover(self.epsolar_client)
+        values = self.epsolar_client.read_all()
+        missing = [value.register.name for value in values if value.value is None]
+        self.assertEqual(missing, ["Battery Temperature"])
+
+    def test_registers_response_payload(self):
+        response = self.rtu.read_input_registers(0x3100, 4, 1)
+        self.assertIsInstance(response.payload, memoryview)
+        self.assertEqual(len(response.payload), 8)
+        self.assertEqual(response.registers, list(struct.unpack('>4H', response.payload)))
+        self.assertEqual(response.getRegister(0), 4830)
+
+    def test_request_frames_cached(self):
+        sent = []
+        write = self.rtu.socket.write
+        self.rtu.socket.write = lambda frame: sent.append(frame) or write(frame)
+        self.epsolar_client.read_all()
+        frames = dict(self.rtu._frames)
+        first = list(sent)
+        del sent[:]
+        self.epsolar_client.read_all()
+        # the second cycle sends the very same frames, none built again
+        self.assertEqual(sent, first)
+        self.assertEqual(self.rtu._frames, frames)
+        for frame in sent:
+            self.assertTrue(any(frame is cached for cached in frames.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import struct
+import unittest
+
+from pyepsolartracer.client import EPsolarTracerClient
+from pyepsolartracer.simulator import RegisterImage, TracerSimulator, daylight, _frame
+
+
+class TestSimulatorFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = TracerSimulator()
+
+    def request(self, pdu, unit = 1):
+        return self.simulator.handle(_frame(bytes([unit]) + pdu))
+
+    def test_read_input_registers(self):
+        response = self.request(struct.pack('>BHH', 4, 0x311A, 1))
+        self.assertEqual(response[:3], b'\x01\x04\x02')
+        self.assertEqual(struct.unpack('>H', response[3:5])[0], 87)
+        self.assertEqual(response, _frame(response[:-2]))
+
+    def test_read_bits(self):
+        self.simulator.image.set("Day/Night", 1)
+        response = self.request(struct.pack('>BHH', 2, 0x200C, 1))
+        self.assertEqual(response[:4], b'\x01\x02\x01\x01')
+
+    def test_exceptions(self):
+        # rated data is in the input registers, not the holding registers
+        self.assertEqual(self.request(struct.pack('>BHH', 3, 0x3000, 1))[:3], b'\x01\x83\x02')
+        self.assertEqual(self.request(struct.pack('>BHH', 4, 0x3000, 200))[:3], b'\x01\x84\x03')
+        self.assertEqual(self.request(b'\x07')[:3], b'\x01\x87\x01')
+
+    def test_ignores_other_units_and_bad_crc(self):
+        self.assertIsNone(self.request(struct.pack('>BHH', 4, 0x311A, 1), unit = 2))
+        frame = _frame(b'\x01' + struct.pack('>BHH', 4, 0x311A, 1))
+        self.assertIsNone(self.simulator.handle(frame[:-1] + b'\x00'))
+        self.assertEqual(self.simulator.requests, 0)
+
+    def test_writes(self):
+        self.request(struct.pack('>BHHBHH', 16, 0x9001, 2, 4, 300, 0))
+        self.assertEqual(self.simulator.image.get("Battery Capacity"), 300)
+        self.request(struct.pack('>BHH', 5, 0x0002, 0x0000))
+        self.assertEqual(self.simulator.image.get("Manual control the load"), 0)
+
+    def test_evolve(self):
+        image = RegisterImage.tracer()
+        daylight(100.0)(image, 25.0)
+        self.assertEqual(image.get("Charging equipment input power"), 480.0)
+        self.assertEqual(image.get("Day/Night"), 0)
+        daylight(100.0)(image, 75.0)
+        self.assertEqual(image.get("Charging equipment input power"), 0.0)
+        self.assertEqual(image.get("Day/Night"), 1)
+
+
+class TestSimulatorPty(unittest.TestCase):
+
+    def test_client_end_to_end(self):
+        with TracerSimulator() as simulator:
+            client = EPsolarTracerClient(port = simulator.port, baudrate = 115200, timeout = 1)
+            self.assertTrue(client.connect())
+            try:
+                values = client.read_many(["Battery SOC", "Charging equipment input voltage", "Battery Capacity"])
+                self.assertEqual([value.value for value in values], [87, 48.3, 200])
+                self.assertTrue(client.write_output("Battery Capacity", 300))
+                self.assertEqual(client.read_input("Battery Capacity").value, 300)
+            finally:
+                client.close()
+
+if __name__ == '__main__':
+    unittest.main()
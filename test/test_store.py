@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyepsolartracer.client import EPsolarTracerClient
+from pyepsolartracer.registers import registers, coils
+from pyepsolartracer.store import StoreWriter, StoreReader
+from test.testdata import ModbusImageMockClient
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestSampleStore(unittest.TestCase):
+    """Test for the binary sample store"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "samples.bin")
+        self.names = [reg.name for reg in registers] + [reg.name for reg in coils]
+        self.values = EPsolarTracerClient(serialclient = ModbusImageMockClient()).read_many(self.names)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        writer = StoreWriter(self.path, self.names)
+        for t in range(3):
+            writer.append(1000.0 + t, self.values)
+        writer.close()
+        reader = StoreReader(self.path)
+        self.assertEqual(len(reader), 3)
+        columns = reader.columns()
+        self.assertEqual(list(columns['time']), [1000.0, 1001.0, 1002.0])
+        for value in self.values:
+            self.assertAlmostEqual(columns[value.register.name][2], float(value.value), msg = value.register.name)
+
+    def test_aliases_share_words(self):
+        writer = StoreWriter(self.path, ["Battery Current", "Battery Current L", "Battery Current H"])
+        self.assertEqual(writer.layout.record.size, 8 + 2 * 2 + 1)
+        writer.close()
+
+    def test_missing_values_and_time_range(self):
+        names = ["Battery SOC", "Battery Capacity"]
+        writer = StoreWriter(self.path, names)
+        soc, capacity = EPsolarTracerClient(serialclient = ModbusImageMockClient()).read_many(names)
+        writer.append(10.0, [soc, capacity])
+        writer.append(20.0, [soc])
+        writer.append(30.0, [soc, capacity])
+        writer.close()
+        columns = StoreReader(self.path).columns(["Battery Capacity"], start = 15, end = 30)
+        self.assertEqual(list(columns['time']), [20.0])
+        self.assertTrue(np.isnan(columns["Battery Capacity"][0]))
+
+    def test_unknown_names_are_nan(self):
+        writer = StoreWriter(self.path, ["Battery SOC"])
+        writer.append(10.0, [v for v in self.values if v.register.name == "Battery SOC"])
+        writer.append(20.0, [])
+        writer.close()
+        columns = StoreReader(self.path).columns(["Battery SOC", "Battery Temperature"])
+        self.assertEqual(columns["Battery SOC"][0], 87)
+        self.assertEqual(len(columns["Battery Temperature"]), 2)
+        self.assertTrue(np.isnan(columns["Battery Temperature"]).all())
+
+    def test_append_to_existing(self):
+        writer = StoreWriter(self.path, self.names)
+        writer.append(1.0, self.values)
+        writer.close()
+        # simulate a crash in the middle of a record
+        with open(self.path, 'ab') as f:
+            f.write(b'\0\0\0')
+        writer = StoreWriter(self.path, self.names)
+        writer.append(2.0, self.values)
+        writer.close()
+        self.assertEqual(list(StoreReader(self.path).times()), [1.0, 2.0])
+        self.assertRaises(ValueError, StoreWriter, self.path, self.names[:3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+import unittest
+
+from pyepsolartracer.client import EPsolarTracerClient, clock_values
+from pyepsolartracer.asyncclient import AsyncEPsolarTracerClient
+from pyepsolartracer.blocks import plan_writes, HOLDING_REGISTER, COIL
+from pyepsolartracer.registers import registerByName
+from test.testdata import ModbusImageMockClient, AsyncModbusMockClient
+
+
+class TestEncode(unittest.TestCase):
+
+    def test_round_trip(self):
+        for name, value in [("Boost voltage", 14.4), ("Battery temperature warning lower limit", -5.5),
+                            ("Battery Capacity", 200), ("Battery Current", -12.34),
+                            ("Total generated energy", 123456.78)]:
+            reg = registerByName(name)
+            self.assertEqual(reg.decode_words(reg.encode_words(value)).value, value)
+
+    def test_two_words(self):
+        reg = registerByName("Battery Current")
+        self.assertEqual(reg.encode(-1.0), [0xff9c, 0xffff])
+        self.assertEqual(registerByName("Battery Capacity").encode(200), 200)
+        # rounded, not truncated
+        self.assertEqual(registerByName("Boost voltage").encode(0.29), 29)
+
+    def test_out_of_range(self):
+        reg = registerByName("Boost voltage")
+        self.assertEqual(reg.encode(655.35), 0xffff)
+        self.assertEqual(reg.encode(-327.68), 0x8000)
+        for value in (700, 655.36, -327.69):
+            with self.assertRaises(ValueError):
+                reg.encode_words(value)
+        with self.assertRaises(ValueError):
+            registerByName("Battery Current").encode_words(2 ** 32 / 100)
+
+
+class TestPlanWrites(unittest.TestCase):
+
+    def test_contiguous_registers_share_a_block(self):
+        blocks = plan_writes([(registerByName(name), 0) for name in
+                              ["Boost voltage", "Float voltage", "Battery Type", "Battery Capacity",
+                               "Manual control the load", "Equalization charging cycle"]])
+        self.assertEqual([(b.kind, b.address, b.count) for b in blocks], [
+            (COIL, 0x0002, 1),
+            (HOLDING_REGISTER, 0x9000, 2),
+            (HOLDING_REGISTER, 0x9007, 2),
+            (HOLDING_REGISTER, 0x9016, 1),
+        ])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            plan_writes([(registerByName("Battery SOC"), 50)])
+        with self.assertRaises(ValueError):
+            plan_writes([(registerByName("Battery Current"), 1.0), (registerByName("Battery Current L"), 0)])
+
+
+class TestWriteMany(unittest.TestCase):
+
+    def setUp(self):
+        self.mock = ModbusImageMockClient()
+        self.epsolar_client = EPsolarTracerClient(serialclient = self.mock)
+
+    def test_profile_in_one_transaction(self):
+        profile = {"Battery Type": 1, "Battery Capacity": 400, "Temperature compensation coefficient": 3}
+        self.assertTrue(self.epsolar_client.write_many(profile))
+        self.assertEqual(self.mock.transactions, 1)
+        values = self.epsolar_client.read_many(list(profile))
+        self.assertEqual([value.value for value in values], list(profile.values()))
+
+    def test_write_output(self):
+        self.assertTrue(self.epsolar_client.write_output("Manual control the load", 0))
+        self.assertEqual(self.mock.writes, [(5, 0x0002, 0)])
+        self.assertFalse(self.epsolar_client.write_output("Battery SOC", 50))
+        self.assertEqual(self.mock.transactions, 1)
+
+    def test_value_out_of_range(self):
+        self.assertFalse(self.epsolar_client.write_output("Boost voltage", 700))
+        self.assertEqual(self.mock.transactions, 0)
+
+    def test_failed_write(self):
+        del self.mock.image[(3, 0x9002)]
+        self.assertFalse(self.epsolar_client.write_many({"Battery Capacity": 100, "Temperature compensation coefficient": 3}))
+        self.assertEqual(self.mock.writes, [])
+
+    def test_clock(self):
+        when = datetime.datetime(2023, 6, 3, 14, 5, 1)
+        self.assertTrue(self.epsolar_client.sync_clock(when))
+        self.assertEqual(self.mock.writes, [(16, 0x9013, 3)])
+        self.assertEqual(self.epsolar_client.read_clock(), when)
+        self.assertEqual(clock_values(when)["Real time clock 3"], 6 | (23 << 8))
+
+    def test_async(self):
+        mock = AsyncModbusMockClient(self.mock)
+        client = AsyncEPsolarTracerClient(serialclient = mock)
+        when = datetime.datetime(2024, 2, 29, 23, 59, 58)
+        self.assertTrue(asyncio.run(client.sync_clock(when)))
+        self.assertEqual(asyncio.run(client.read_clock()), when)
+
+
+if __name__ == '__main__':
+    unittest.main()
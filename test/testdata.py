@@ -3,8 +3,12 @@
 
 from pymodbus.constants import Defaults
 from pymodbus.client import ModbusBaseClient
+from pymodbus.client.mixin import ModbusClientMixin
 from pymodbus.transaction import ModbusAsciiFramer, ModbusRtuFramer
 from pymodbus.exceptions import ParameterException
+from pymodbus.utilities import computeCRC
+import struct
+import asyncio
 
 #---------------------------------------------------------------------------#
 # Logging
@@ -99,13 +103,137 @@ class ModbusMockClient(ModbusBaseClient):
         '''
         return "%s baud[%s]" % (self.method, self.baudrate)
 
+class ModbusImageMockClient(ModbusMockClient):
+    ''' Mock client answering any read from an in-memory register image
+
+    Unlike ModbusMockClient this is not limited to prerecorded requests, so
+    block reads of arbitrary size can be tested. Writes (function codes 5,
+    6, 15 and 16) update the image. Requests touching an address missing
+    from the image are answered with exception 2 (illegal address).
+    '''
+
+    def __init__(self, image = None, **kwargs):
+        ModbusMockClient.__init__(self, **kwargs)
+        self.image = image if image is not None else dict(registerImage)
+        self.transactions = 0
+        # (function code, address, value or count) of every accepted write
+        self.writes = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def send(self, request):
+        _logger.debug ("send " + repr(request))
+        self.transactions += 1
+        self.bytes_sent += len(request)
+        if request[1] == 0x2b:
+            # device information, as recorded
+            self.data = testdata.get(request, b'')
+            return len(request)
+        slave, function, address, count = struct.unpack('>BBHH', request[0:6])
+        if function in (5, 6, 15, 16):
+            self.data = self._write(request)
+            return len(request)
+        data = []
+        for i in range(count):
+            if (function, address + i) not in self.image:
+                self.data = self._frame(struct.pack('>BBB', slave, function | 0x80, 2))
+                return len(request)
+            data.append(self.image[(function, address + i)])
+        if function in (1, 2):
+            bits = 0
+            for i, bit in enumerate(data):
+                bits |= (bit & 1) << i
+            payload = bits.to_bytes((count + 7) // 8, 'little')
+        else:
+            payload = struct.pack('>%dH' % count, *data)
+        self.data = self._frame(struct.pack('>BBB', slave, function, len(payload)) + payload)
+        return len(request)
+
+    def _write(self, request):
+        slave, function, address, value = struct.unpack('>BBHH', request[0:6])
+        if function == 5:
+            # coils are read from the image with function code 1
+            updates = {(1, address): 1 if value else 0}
+        elif function == 6:
+            updates = {(3, address): value}
+        elif function == 15:
+            bits = int.from_bytes(request[7:7 + request[6]], 'little')
+            updates = {(1, address + i): (bits >> i) & 1 for i in range(value)}
+        else:
+            words = struct.unpack('>%dH' % value, request[7:7 + 2 * value])
+            updates = {(3, address + i): word for i, word in enumerate(words)}
+        if any(key not in self.image for key in updates):
+            return self._frame(struct.pack('>BBB', slave, function | 0x80, 2))
+        self.image.update(updates)
+        self.writes.append((function, address, value))
+        return self._frame(request[0:6])
+
+    def recv(self, size):
+        data = ModbusMockClient.recv(self, size)
+        self.bytes_received += len(data)
+        return data
+
+    @staticmethod
+    def _frame(pdu):
+        return pdu + computeCRC(pdu).to_bytes(2, 'big')
+
+class AsyncModbusMockClient(ModbusClientMixin):
+    ''' asyncio facade of a mock client, behaving like AsyncModbusSerialClient
+
+    The read/write helpers of the mixin hand out coroutines of execute().
+    '''
+
+    def __init__(self, client = None):
+        ModbusClientMixin.__init__(self)
+        self.sync = client if client is not None else ModbusMockClient()
+
+    async def connect(self):
+        return self.sync.connect()
+
+    async def close(self):
+        self.sync.close()
+
+    async def execute(self, request = None):
+        # give other tasks a chance, like a real transport would
+        await asyncio.sleep(0)
+        return self.sync.execute(request)
+
 #---------------------------------------------------------------------------#
 # Exported symbols
 #---------------------------------------------------------------------------#
 __all__ = [
-    "ModbusMockClient"
+    "ModbusMockClient",
+    "ModbusImageMockClient",
+    "AsyncModbusMockClient",
 ]
 
+# Register image of a Tracer2215BN, keyed by (read function code, address).
+# The address ranges are dense, like on the real device
+registerImage = {}
+registerImage.update({(4, 0x3000 + i): v for i, v in enumerate([
+    15000, 2000, 0xe240, 0x0001, 2400, 2000, 0xe240, 0x0001, 1,
+    0, 0, 0, 0, 0, 2000])})
+registerImage.update({(4, 0x3100 + i): v for i, v in enumerate([
+    4830, 125, 0x1b2c, 0x0000, 2710, 215, 0x16b2, 0x0000, 0, 0,
+    0, 0, 2690, 30, 0x1f86, 0x0000, 0xff38, 2510, 2630, 0, 0,
+    0, 0, 0, 0, 0, 87, 2500, 0, 2400])})
+registerImage.update({(4, 0x3200 + i): v for i, v in enumerate([0, 0x0009])})
+registerImage.update({(4, 0x3300 + i): v for i, v in enumerate([
+    5120, 12, 2850, 2480, 45, 0, 1210, 0, 15400, 0, 0x5d40, 0x0002,
+    142, 0, 3120, 0, 0x9a50, 0x0000, 0xd2f0, 0x0003, 0x0420, 0x0001,
+    0, 0, 0, 0, 0, 0xff9c, 0xffff, 2510, 1930])})
+registerImage.update({(3, 0x9000 + i): v for i, v in enumerate([
+    1, 200, 300, 1600, 1500, 1500, 1460, 1440, 1380, 1320, 1260, 1220,
+    1200, 1110, 1060, 0, 0, 0, 0, 0x1805, 0x0202, 0x170f, 30, 6500,
+    0xf060, 8500, 7500, 8500, 7500, 0, 500, 10, 600, 10])})
+registerImage.update({(3, 0x903d + i): v for i, v in enumerate([
+    0, 0x0100, 0x0100, 0, 0, 0, 0, 19, 0, 0, 6, 0, 0, 19, 0, 0, 6])})
+registerImage.update({(3, 0x9065 + i): v for i, v in enumerate([
+    0x030f, 0, 0, 0, 0, 1, 120, 120, 30, 100, 0, 0])})
+registerImage.update({(1, 0x0000 + i): v for i, v in enumerate([0, 0, 1, 0, 0, 0, 0, 0])})
+registerImage.update({(2, 0x2000 + i): v for i, v in enumerate([
+    0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1])})
+
 testdata = {
   b'\x01+\x0e\x01\x00pw'
 : b'\x01+\x0e\x01\x01\x00\x00\x03\x00\x15EPsolar Tech co., Ltd\x01\x0cTracer2215BN\x02\rV02.05+V07.12\xd7\xd8'
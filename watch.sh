@@ -1,10 +1,7 @@
 #!/bin/bash
 
-# small script to log info.py to a file, could probably be done in python as well, but hey, works
+# small script to log the registers to a file every 10 seconds
+# the poller keeps the port open between samples, no need to restart python every time
 
-while true; do
-date >> log.txt
-python3 info.py | grep -vE "Carbon|rated|Light|Day|timing|time" | uniq >> log.txt
-echo "" >> log.txt
-sleep 10
-done
+exec python3 -m pyepsolartracer.poll --rs485 --interval 10 --output log.txt \
+    --exclude "Carbon|rated|Light|Day|timing|time"